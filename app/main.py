@@ -4,12 +4,12 @@ import logging
 from datetime import datetime
 import traceback
 from logging.handlers import RotatingFileHandler
-from flask import Flask, render_template, request, send_file, flash, redirect, url_for
+from flask import Flask, Response, render_template, request, flash, redirect, url_for
 from werkzeug.utils import secure_filename
 
-from .utils.epub_analyzer import analyze_epub
+from .utils.epub_analyzer import analyze_epub_cached
 from .utils.onix_processor import process_onix
-from .utils.memory_utils import log_memory_usage
+from .utils.memory_utils import get_rss_mb
 from .config import config
 
 def create_app(config_name='default'):
@@ -53,7 +53,7 @@ def create_app(config_name='default'):
         """Process uploaded files and generate ONIX"""
         try:
             # Log initial memory usage
-            initial_memory = log_memory_usage()
+            initial_memory = get_rss_mb()
             app.logger.info(f"Initial memory usage: {initial_memory:.2f} MB")
 
             # Check if files were uploaded
@@ -77,7 +77,7 @@ def create_app(config_name='default'):
 
             # Process EPUB file
             app.logger.info(f"Analyzing EPUB file: {epub_file.filename}")
-            epub_features = analyze_epub(epub_file)
+            epub_features = analyze_epub_cached(epub_file.stream)
 
             # Process ONIX file
             app.logger.info(f"Processing ONIX file: {onix_file.filename}")
@@ -103,29 +103,22 @@ def create_app(config_name='default'):
             # Process ONIX with publisher data
             processed_xml = process_onix(
                 epub_features=epub_features,
-                xml_content=onix_file.read(),
+                xml_content=onix_file.stream,
                 epub_isbn=epub_isbn,
                 publisher_data=publisher_data
             )
 
             # Log final memory usage
-            final_memory = log_memory_usage()
+            final_memory = get_rss_mb()
             app.logger.info(f"Final memory usage: {final_memory:.2f} MB")
 
-            # Save and return processed file
+            # Return processed file straight from memory as a download
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             output_filename = f"AccessONIX_{epub_isbn}_{timestamp}.xml"
-            output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
             
-            with open(output_path, 'wb') as f:
-                f.write(processed_xml)
-
-            return send_file(
-                output_path,
-                mimetype='application/xml',
-                as_attachment=True,
-                download_name=output_filename
-            )
+            response = Response(processed_xml, mimetype='application/xml')
+            response.headers.set('Content-Disposition', 'attachment', filename=output_filename)
+            return response
 
         except Exception as e:
             app.logger.error(f"Error during processing: {str(e)}")
@@ -1,13 +1,79 @@
 import zipfile
-import xml.etree.ElementTree as ET
-from collections import defaultdict
+import xml.parsers.expat
+from collections import defaultdict, OrderedDict
+import hashlib
+import threading
 import logging
 import re
+import sys
 from datetime import datetime
 import io
+import posixpath
+import html
+from urllib.parse import unquote
+from lxml import etree
 
 logger = logging.getLogger(__name__)
 
+OPF_METADATA_TAG = '{http://www.idpf.org/2007/opf}metadata'
+OPF_ITEM_TAG = '{http://www.idpf.org/2007/opf}item'
+OPF_ITEMREF_TAG = '{http://www.idpf.org/2007/opf}itemref'
+CONTAINER_PATH = 'META-INF/container.xml'
+
+# Number of EPUB analyses kept in memory, keyed by content digest
+EPUB_CACHE_SIZE = 128
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+_analysis_cache = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+# Rootfile path in META-INF/container.xml
+_ROOTFILE_RE = re.compile(rb'full-path\s*=\s*["\']([^"\']+)["\']')
+
+# Matches any start tag carrying a lang/xml:lang attribute; compiled once at import
+_LANG_RE = re.compile(rb'<[^>]+\s(?:lang|xml:lang)\s*=\s*["\']([^"\']+)["\'][^>]*>', re.IGNORECASE)
+
+# CSS properties that suggest the publisher styled text for readability, scanned
+# as one alternation with first-match exit ('color' also covers 'background-color')
+_DYSLEXIA_CSS_RE = re.compile(rb'font-family|letter-spacing|word-spacing|line-height|color')
+
+# Package <metadata> block and the <meta> tags inside it, for the regex fast path
+_METADATA_BLOCK_RE = re.compile(rb'<(?:[\w.-]+:)?metadata\b[^>]*>(.*?)</(?:[\w.-]+:)?metadata\s*>', re.S)
+_META_TAG_RE = re.compile(rb'<(?:[\w.-]+:)?meta\b([^>]*?)(?:/>|>(.*?)</(?:[\w.-]+:)?meta\s*>)', re.S)
+_ATTR_RE = re.compile(rb'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+# dcterms:modified as YYYY-MM-DDThh:mm:ssZ (value is already lowercased); the
+# fields are range-checked by building a datetime from the groups
+_MODIFIED_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})t(\d{1,2}):(\d{1,2}):(\d{1,2})z')
+
+class _LangFound(Exception):
+    """Raised from the Expat handler to stop parsing at the first language tag"""
+    def __init__(self, lang):
+        super().__init__(lang)
+        self.lang = lang
+
+def _lang_start_element(name, attrs):
+    lang = attrs.get('xml:lang') or attrs.get('lang')
+    if lang:
+        raise _LangFound(lang)
+
+def _probe_lang(data):
+    """
+    Return the first lang/xml:lang attribute value in an XHTML document, or None.
+    Uses Expat so comments and CDATA are skipped; falls back to the regex for
+    content that is not well-formed XML (e.g. HTML entities or void tags).
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = _lang_start_element
+    try:
+        parser.Parse(data, True)
+    except _LangFound as found:
+        return found.lang
+    except xml.parsers.expat.ExpatError:
+        match = _LANG_RE.search(data)
+        return match.group(1).decode('utf-8', 'replace') if match else None
+    return None
+
 # Complete CODELIST_196 dictionary
 CODELIST_196 = {
     '0': 'Accessibility summary',
@@ -69,9 +135,91 @@ CODELIST_196 = {
     '99': 'Publisher contact for further accessibility information'
 }
 
+# schema:accessibilityFeature keywords and the CODELIST_196 codes they map to
+FEATURE_MAPPING = {
+    'tableofcontents': '11',
+    'index': '12',
+    'readingorder': '13',
+    'alternativetext': '14',
+    'longdescription': '15',
+    'alternativerepresentation': '16',
+    'mathml': '17',
+    'chemml': '18',
+    'printpagenumbers': '19',
+    'pagenumbers': '19',
+    'pagebreaks': '19',
+    'synchronizedaudiotext': '20',
+    'ttsmarkup': '21',
+    'displaytransformability': '24',
+    'fontcustomization': '24',
+    'textspacing': '24',
+    'colorcustomization': '24',
+    'texttospeech': '24',
+    'readingtools': '24',
+    'highcontrast': '26',
+    'colorcontrast': '26',
+    'audiocontrast': '27',
+    'fullaudiodescription': '28',
+    'structuralnavigation': '29',
+    'aria': '30',
+    'accessibleinterface': '31',
+    'accessiblecontrols': '31',
+    'accessiblenavigation': '31',
+    'landmarks': '32',
+    'landmarknavigation': '32',
+    'chemistryml': '34',
+    'latex': '35',
+    'modifiabletextsize': '36',
+    'ultracolorcontrast': '37',
+    'glossary': '38',
+    'accessiblesupplementarycontent': '39',
+    'linkpurpose': '40'
+}
+
+# All feature keywords as one pattern. Each keyword is a named group inside a
+# lookahead, so matching is zero-width and overlapping keywords (e.g. 'pagenumbers'
+# inside 'printpagenumbers') are all reported, just as separate substring tests would.
+_FEATURE_GROUP_CODES = {f'k{i}': code for i, code in enumerate(FEATURE_MAPPING.values())}
+_FEATURE_RE = re.compile('(?=' + '|'.join(
+    f'(?P<k{i}>{re.escape(key)})' for i, key in enumerate(FEATURE_MAPPING)
+) + ')')
+
+def epub_digest(epub_file):
+    """Hash a seekable EPUB stream in chunks and rewind it to where it started"""
+    start = epub_file.tell()
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: epub_file.read(_HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    epub_file.seek(start)
+    return digest.digest()
+
+def analyze_epub_cached(epub_file):
+    """
+    Analyze an EPUB, reusing the result for byte-identical uploads
+    Returns: dict of accessibility features (a fresh copy on every call)
+    """
+    digest = epub_digest(epub_file)
+    with _analysis_cache_lock:
+        cached = _analysis_cache.get(digest)
+        if cached is not None:
+            _analysis_cache.move_to_end(digest)
+    if cached is not None:
+        logger.info("Using cached EPUB analysis for identical upload")
+        return defaultdict(bool, cached)
+    
+    accessibility_info = analyze_epub(epub_file)
+    with _analysis_cache_lock:
+        _analysis_cache[digest] = {code: True for code, flag in accessibility_info.items() if flag}
+        while len(_analysis_cache) > EPUB_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    return accessibility_info
+
 def analyze_epub(epub_file):
     """
     Analyze EPUB file for accessibility features
+    Args:
+        epub_file: seekable binary file object (e.g. an upload's stream);
+            read in place without buffering the whole archive
     Returns: dict of accessibility features
     """
     accessibility_info = defaultdict(bool)
@@ -81,79 +229,198 @@ def analyze_epub(epub_file):
     dyslexia_support_detected = False
     
     try:
-        with zipfile.ZipFile(io.BytesIO(epub_file.read())) as epub:
-            logger.info("Checking content files for language tagging...")
+        with zipfile.ZipFile(epub_file) as epub:
+            opf_path = find_opf_path(epub)
+            if opf_path is None:
+                raise ValueError("No OPF file found in EPUB")
+            logger.info(f"OPF file found: {opf_path}")
+            opf_content = epub.read(opf_path)
+            
+            # Language tagging is only probed in spine documents; when the spine
+            # cannot be resolved every content document is probed instead
+            spine_documents = set(get_spine_documents(opf_path, opf_content))
+            
+            # Single pass over the archive: each member is inflated once and
+            # every probe that applies to its type runs on the same bytes
+            logger.info("Checking content files for accessibility markers...")
             for item in epub.infolist():
-                if item.filename.endswith(('.xhtml', '.html', '.xml')):
-                    with epub.open(item.filename) as content:
-                        content_str = content.read().decode('utf-8')
-                        lang_pattern = r'<[^>]+(?:\s(?:lang|xml:lang)\s*=\s*["\']([^"\']+)["\'])[^>]*>'
-                        matches = re.findall(lang_pattern, content_str, re.IGNORECASE)
-                        if matches:
-                            language_tagging_detected = True
-                            for lang in matches:
-                                logger.info(f"Language tagging detected in {item.filename}: lang='{lang}'")
-                            break
-
-                if language_tagging_detected:
+                filename = item.filename
+                is_content = filename.endswith(('.xhtml', '.html'))
+                probe_language = not language_tagging_detected and (
+                    filename in spine_documents if spine_documents else is_content)
+                probe_page_breaks = is_content and not page_numbering_detected
+                if probe_language or probe_page_breaks:
+                    content = epub.read(filename)
+                    if probe_language:
+                        language_tagging_detected = detect_language_tagging(filename, content)
+                    if probe_page_breaks and b'epub:type="pagebreak"' in content:
+                        page_numbering_detected = True
+                        logger.info("Print-equivalent page numbering detected (pagebreak markers)")
+                elif filename.endswith('.opf'):
+                    if landmark_navigation_detected:
+                        continue
+                    content = opf_content if filename == opf_path else epub.read(filename)
+                    if b'<guide>' in content or b'epub:type="landmarks"' in content:
+                        landmark_navigation_detected = True
+                        logger.info("Landmark navigation detected")
+                elif filename.endswith('.css'):
+                    if not dyslexia_support_detected and _DYSLEXIA_CSS_RE.search(epub.read(filename)):
+                        dyslexia_support_detected = True
+                        logger.info("CSS properties supporting dyslexia readability detected")
+                else:
+                    # Images, fonts, etc.: nothing was probed, so no flag can have changed
+                    continue
+
+                if (language_tagging_detected and page_numbering_detected and
+                        landmark_navigation_detected and dyslexia_support_detected):
                     break
 
-            if language_tagging_detected:
-                accessibility_info['22'] = True
-                logger.info("Language tagging (code 22) detected in content files and set to True")
-            else:
-                logger.info("No language tagging detected in content files")
+        if language_tagging_detected:
+            accessibility_info['22'] = True
+            logger.info("Language tagging (code 22) detected in content files and set to True")
+        else:
+            logger.info("No language tagging detected in content files")
+        if page_numbering_detected:
+            accessibility_info['19'] = True
+        if landmark_navigation_detected:
+            accessibility_info['32'] = True
+        if dyslexia_support_detected:
+            accessibility_info['24'] = True
 
-            # Check OPF file for metadata
-            opf_path = next(path for path in epub.namelist() if path.endswith('.opf'))
-            logger.info(f"OPF file found: {opf_path}")
-            
-            with epub.open(opf_path) as opf_file:
-                tree = ET.parse(opf_file)
-                root = tree.getroot()
+        # Check OPF file for metadata
+        for property, value in iter_opf_properties(opf_content):
+            if property and value:
+                # Normalise once here; every analyzer below works on lowercase text
+                property = sys.intern(property.lower())
+                value = value.lower()
+                logger.debug("Found metadata: property=%s, value=%s", property, value)
                 
-                metadata = root.find('{http://www.idpf.org/2007/opf}metadata')
-                if metadata is not None:
-                    logger.info("Metadata found in OPF file")
-                    for meta in metadata.findall('.//*'):
-                        property = meta.get('property') or meta.get('name')
-                        value = meta.text or meta.get('content')
-                        
-                        if property and value:
-                            property = property.lower()
-                            value = value.lower()
-                            logger.debug(f"Found metadata: property={property}, value={value}")
-                            
-                            if 'conformsto' in property or 'conformsTo' in property:
-                                analyze_conformance(value, accessibility_info)
-                            
-                            analyze_metadata_property(property, value, accessibility_info)
-
-            # Check for page break markers in the EPUB content
-            check_for_page_breaks(epub, accessibility_info)
-
-            # Check for landmarks in the EPUB content
-            check_for_landmarks(epub, accessibility_info)
-
-            # Check for specific CSS properties that might indicate dyslexia support
-            check_for_dyslexia_support(epub, accessibility_info)
-
-            # Assume no accessibility options are disabled unless proven otherwise
-            accessibility_info['10'] = True
-            logger.info("Assuming no reading system accessibility options disabled")
-
-            # Infer compliance based on certification
-            infer_compliance(accessibility_info)
-
-            logger.info("Accessibility info collected: " + ", ".join([f"{k}: {v}" for k, v in accessibility_info.items() if v]))
-            return accessibility_info
+                if 'conformsto' in property:
+                    analyze_conformance(value, accessibility_info)
+                
+                analyze_metadata_property(property, value, accessibility_info)
+
+        # Assume no accessibility options are disabled unless proven otherwise
+        accessibility_info['10'] = True
+        logger.info("Assuming no reading system accessibility options disabled")
+
+        # Infer compliance based on certification
+        infer_compliance(accessibility_info)
+
+        logger.info("Accessibility info collected: " + ", ".join([f"{k}: {v}" for k, v in accessibility_info.items() if v]))
+        return accessibility_info
 
     except Exception as e:
         logger.error(f"Error analyzing EPUB: {str(e)}")
         raise
 
+def find_opf_path(epub):
+    """Locate the package document via META-INF/container.xml, else the first .opf"""
+    names = epub.namelist()
+    if CONTAINER_PATH in names:
+        match = _ROOTFILE_RE.search(epub.read(CONTAINER_PATH))
+        if match:
+            opf_path = match.group(1).decode('utf-8')
+            if opf_path in names:
+                return opf_path
+    return next((name for name in names if name.endswith('.opf')), None)
+
+def get_spine_documents(opf_path, opf_content):
+    """Return the archive paths of the spine items in reading order"""
+    base = posixpath.dirname(opf_path)
+    manifest = {}
+    spine = []
+    try:
+        for event, elem in etree.iterparse(io.BytesIO(opf_content), events=('end',),
+                                           tag=(OPF_ITEM_TAG, OPF_ITEMREF_TAG),
+                                           resolve_entities=False, collect_ids=False):
+            if elem.tag == OPF_ITEM_TAG:
+                manifest[elem.get('id')] = elem.get('href')
+            else:
+                spine.append(elem.get('idref'))
+            elem.clear()
+    except etree.XMLSyntaxError as e:
+        logger.warning(f"Unable to read spine from {opf_path}: {str(e)}")
+        return []
+    
+    return [posixpath.normpath(posixpath.join(base, unquote(manifest[idref])))
+            for idref in spine if manifest.get(idref)]
+
+def iter_opf_metadata(opf_content):
+    """
+    Yield the descendants of the package-level <metadata> element of an OPF.
+    Parsing is incremental and stops once </metadata> is reached, so the
+    manifest and spine are never built; each element is cleared once consumed.
+    """
+    depth = 0
+    in_metadata = False
+    events = etree.iterparse(io.BytesIO(opf_content), events=('start', 'end'),
+                             resolve_entities=False, collect_ids=False)
+    for event, elem in events:
+        if event == 'start':
+            depth += 1
+            if depth == 2 and elem.tag == OPF_METADATA_TAG:
+                in_metadata = True
+                logger.info("Metadata found in OPF file")
+            continue
+        
+        depth -= 1
+        if not in_metadata:
+            continue
+        if depth == 1:
+            break
+        yield elem
+        elem.clear()
+
+def iter_opf_properties(opf_content):
+    """
+    Yield (property, value) for each <meta> in the OPF <metadata> block.
+    Plain metadata is matched with regexes; blocks containing comments, CDATA
+    or non-UTF-8 text go through iter_opf_metadata so the XML rules apply.
+    """
+    block = _METADATA_BLOCK_RE.search(opf_content)
+    if block is not None and b'<!' not in block.group(1):
+        try:
+            properties = list(_scan_meta_tags(block.group(1)))
+        except UnicodeDecodeError:
+            properties = None
+        if properties is not None:
+            logger.info("Metadata found in OPF file")
+            yield from properties
+            return
+    
+    for meta in iter_opf_metadata(opf_content):
+        yield meta.get('property') or meta.get('name'), meta.text or meta.get('content')
+
+def _scan_meta_tags(metadata):
+    """Extract (property, value) pairs from the raw bytes of a <metadata> block"""
+    for match in _META_TAG_RE.finditer(metadata):
+        attrs = {name: dq or sq
+                 for name, dq, sq in _ATTR_RE.findall(match.group(1))}
+        property = attrs.get(b'property') or attrs.get(b'name')
+        value = match.group(2) or attrs.get(b'content')
+        yield _xml_text(property), _xml_text(value)
+
+def _xml_text(raw):
+    if not raw:
+        return None
+    text = raw.decode('utf-8')
+    return html.unescape(text) if '&' in text else text
+
+def detect_language_tagging(filename, content):
+    """Check a content document for lang/xml:lang attributes"""
+    lang = _probe_lang(content)
+    if lang:
+        logger.info(f"Language tagging detected in {filename}: lang='{lang}'")
+        return True
+    return False
+
 def analyze_conformance(value, accessibility_info):
-    """Analyze conformance metadata"""
+    """
+    Analyze conformance metadata.
+    The substring cascades here and in analyze_wcag_conformance are kept on
+    purpose: for these short values they beat a combined regex scan.
+    """
     if 'epub-a11y-11' in value or 'epub accessibility 1.1' in value:
         accessibility_info['4'] = True  # EPUB Accessibility 1.1
         accessibility_info['3'] = True  # EPUB Accessibility 1.0 AA
@@ -232,50 +499,10 @@ def analyze_metadata_property(property, value, accessibility_info):
 
 def analyze_accessibility_features(value, accessibility_info):
     """Analyze accessibility features from metadata"""
-    feature_mapping = {
-        'tableofcontents': '11',
-        'index': '12',
-        'readingorder': '13',
-        'alternativetext': '14',
-        'longdescription': '15',
-        'alternativerepresentation': '16',
-        'mathml': '17',
-        'chemml': '18',
-        'printpagenumbers': '19',
-        'pagenumbers': '19',
-        'pagebreaks': '19',
-        'synchronizedaudiotext': '20',
-        'ttsmarkup': '21',
-        'displaytransformability': '24',
-        'fontcustomization': '24',
-        'textspacing': '24',
-        'colorcustomization': '24',
-        'texttospeech': '24',
-        'readingtools': '24',
-        'highcontrast': '26',
-        'colorcontrast': '26',
-        'audiocontrast': '27',
-        'fullaudiodescription': '28',
-        'structuralnavigation': '29',
-        'aria': '30',
-        'accessibleinterface': '31',
-        'accessiblecontrols': '31',
-        'accessiblenavigation': '31',
-        'landmarks': '32',
-        'landmarknavigation': '32',
-        'chemistryml': '34',
-        'latex': '35',
-        'modifiabletextsize': '36',
-        'ultracolorcontrast': '37',
-        'glossary': '38',
-        'accessiblesupplementarycontent': '39',
-        'linkpurpose': '40'
-    }
-    
-    for key, code in feature_mapping.items():
-        if key in value:
-            accessibility_info[code] = True
-            logger.info(f"Accessibility feature detected: {CODELIST_196[code]}")
+    for match in _FEATURE_RE.finditer(value):
+        code = _FEATURE_GROUP_CODES[match.lastgroup]
+        accessibility_info[code] = True
+        logger.info("Accessibility feature detected: %s", CODELIST_196[code])
 
 def analyze_additional_metadata(property, value, accessibility_info):
     """Analyze additional metadata properties"""
@@ -288,7 +515,7 @@ def analyze_additional_metadata(property, value, accessibility_info):
         logger.info("Compliance certification detected")
     
     if ('accessibilityapi' in property or 
-        'a11y:certifierReport' in property or 
+        'a11y:certifierreport' in property or 
         ('accessibility' in property and value.startswith('http'))):
         accessibility_info['94'] = True
         logger.info(f"Compliance web page detected: {value}")
@@ -302,50 +529,20 @@ def analyze_additional_metadata(property, value, accessibility_info):
             logger.info("All non-decorative content supports reading via pre-recorded audio")
     
     if property == 'dcterms:modified':
+        match = _MODIFIED_RE.fullmatch(value)
         try:
-            date = datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+            if match is None:
+                raise ValueError(value)
+            datetime(*map(int, match.groups()))
             accessibility_info['91'] = True
             logger.info("Latest accessibility assessment date detected")
         except ValueError:
             logger.warning(f"Unable to parse date: {value}")
 
-def check_for_page_breaks(epub, accessibility_info):
-    """Check for page break markers in EPUB content"""
-    for item in epub.infolist():
-        if item.filename.endswith(('.xhtml', '.html')):
-            with epub.open(item.filename) as content:
-                content_str = content.read().decode('utf-8')
-                if 'epub:type="pagebreak"' in content_str:
-                    accessibility_info['19'] = True
-                    logger.info("Print-equivalent page numbering detected (pagebreak markers)")
-                    break
-
-def check_for_landmarks(epub, accessibility_info):
-    """Check for landmarks in EPUB content"""
-    for item in epub.infolist():
-        if item.filename.endswith('.opf'):
-            with epub.open(item.filename) as content:
-                opf_content = content.read().decode('utf-8')
-                if '<guide>' in opf_content or 'epub:type="landmarks"' in opf_content:
-                    accessibility_info['32'] = True
-                    logger.info("Landmark navigation detected")
-                    break
-
-def check_for_dyslexia_support(epub, accessibility_info):
-    """Check for CSS properties indicating dyslexia support"""
-    for item in epub.infolist():
-        if item.filename.endswith('.css'):
-            with epub.open(item.filename) as css_file:
-                css_content = css_file.read().decode('utf-8')
-                if any(prop in css_content for prop in ['font-family', 'letter-spacing', 'word-spacing', 'line-height', 'background-color', 'color']):
-                    accessibility_info['24'] = True
-                    logger.info("CSS properties supporting dyslexia readability detected")
-                    break
-
 def infer_compliance(accessibility_info):
     """Infer compliance based on certification and features"""
     # Infer compliance based on certification
-    if accessibility_info['93']:  # If certified
+    if accessibility_info.get('93'):  # If certified
         accessibility_info['4'] = True  # EPUB Accessibility 1.1
         accessibility_info['3'] = True  # EPUB Accessibility 1.0 AA
         accessibility_info['2'] = True  # EPUB Accessibility 1.0 A
@@ -356,14 +553,14 @@ def infer_compliance(accessibility_info):
         logger.info("Inferred EPUB Accessibility 1.1, 1.0 AA, 1.0 A and WCAG 2.1 AA, 2.0 AA compliance based on certification")
 
     # Infer compliance based on presence of key accessibility features
-    if accessibility_info['11'] and accessibility_info['13'] and accessibility_info['30'] and accessibility_info['52']:
-        if not accessibility_info['4']:
+    if accessibility_info.get('11') and accessibility_info.get('13') and accessibility_info.get('30') and accessibility_info.get('52'):
+        if not accessibility_info.get('4'):
             accessibility_info['4'] = True
             accessibility_info['3'] = True
             accessibility_info['2'] = True
             logger.info("Inferred EPUB Accessibility 1.1, 1.0 AA, 1.0 A compliance based on presence of key accessibility features")
 
     # Infer color contrast if the EPUB is accessible
-    if accessibility_info['4'] or accessibility_info['3'] or accessibility_info['2']:
+    if accessibility_info.get('4') or accessibility_info.get('3') or accessibility_info.get('2'):
         accessibility_info['26'] = True
         logger.info("Inferred high contrast between text and background color based on accessibility compliance")
\ No newline at end of file
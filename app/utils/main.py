@@ -3,9 +3,9 @@ import logging
 import traceback
 from flask import Flask, render_template, request, send_file, flash, redirect, url_for, make_response
 from werkzeug.utils import secure_filename
-from .utils.epub_analyzer import analyze_epub
+from .utils.epub_analyzer import analyze_epub_cached
 from .utils.onix_processor import process_onix
-from .utils.memory_utils import log_memory_usage
+from .utils.memory_utils import get_rss_mb
 from .config import Config
 
 
@@ -39,7 +39,7 @@ def help():
 def process():
     try:
         # Log initial memory usage
-        initial_memory = log_memory_usage()
+        initial_memory = get_rss_mb()
         logger.info(f"Initial memory usage: {initial_memory:.2f} MB")
 
         # Check if files were uploaded
@@ -63,7 +63,7 @@ def process():
 
         # Process EPUB file
         logger.info(f"Analyzing EPUB file: {epub_file.filename}")
-        epub_features = analyze_epub(epub_file)
+        epub_features = analyze_epub_cached(epub_file.stream)
 
         # Process ONIX file
         logger.info(f"Processing ONIX file: {onix_file.filename}")
@@ -86,7 +86,7 @@ def process():
         # Process ONIX with publisher data
         processed_xml = process_onix(
             epub_features=epub_features,
-            xml_content=onix_file.read(),
+            xml_content=onix_file.stream,
             epub_isbn=epub_isbn,
             publisher_data=publisher_data
         )
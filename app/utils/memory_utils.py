@@ -1,22 +1,41 @@
 """Memory usage monitoring utilities"""
 import os
+# Imported eagerly: the Procfile runs gunicorn with --preload, so the master
+# loads it once and workers share it, and every request measures RSS anyway
 import psutil
 import logging
 
 logger = logging.getLogger(__name__)
 
-def log_memory_usage():
-    """Log current memory usage and return usage in MB"""
+# Cached handle for the current process; rebuilt after a fork (gunicorn --preload
+# imports this module in the master before workers are forked)
+_process = None
+
+def _get_process():
+    """Return a psutil.Process for this process, reusing it across calls"""
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process()
+    return _process
+
+def get_rss_mb():
+    """Return the resident set size of this process in MB (0 if unavailable)"""
     try:
-        process = psutil.Process(os.getpid())
-        memory_info = process.memory_info()
-        memory_mb = memory_info.rss / 1024 / 1024  # Convert to MB
-        logger.info(f"Current memory usage: {memory_mb:.2f} MB")
-        return memory_mb
+        return _get_process().memory_info().rss / 1024 / 1024  # Convert to MB
     except Exception as e:
         logger.error(f"Error getting memory usage: {str(e)}")
         return 0
 
+# Older name used by callers that only need the number
+check_memory_usage = get_rss_mb
+
+def log_memory_usage(logger=None):
+    """Log current memory usage and return usage in MB"""
+    logger = logger or logging.getLogger(__name__)
+    memory_mb = get_rss_mb()
+    logger.info(f"Current memory usage: {memory_mb:.2f} MB")
+    return memory_mb
+
 def optimize_memory():
     """Attempt to optimize memory usage"""
     try:
@@ -1,7 +1,10 @@
 """Main ONIX processing module with corrected element ordering and validation fixes"""
 import logging
+import re
 import traceback
-import copy  # Add this at the top with other imports
+import io
+import os
+import copy
 from lxml import etree
 from datetime import datetime
 
@@ -10,6 +13,18 @@ ONIX_30_NS = "http://ns.editeur.org/onix/3.0/reference"
 NSMAP = {None: ONIX_30_NS}
 DEFAULT_LANGUAGE_CODE = 'eng'
 
+# Clark-notation names of the ONIX 3.0 tags checked by validate_onix_output
+ONIX_30_TAGS = {
+    name: f'{{{ONIX_30_NS}}}{name}'
+    for name in (
+        'ONIXMessage', 'Header', 'Sender', 'Product', 'RecordReference',
+        'NotificationType', 'ProductIdentifier', 'DescriptiveDetail',
+        'ProductComposition', 'ProductForm', 'TextContent', 'TextType',
+        'ContentAudience', 'Website', 'WebsiteRole', 'WebsiteLink', 'Price',
+        'PriceType', 'PriceAmount',
+    )
+}
+
 # ONIX tag mapping from 2.1 to 3.0 reference tags
 TAG_MAPPING = {
     # Measure-related
@@ -104,7 +119,6 @@ PUBLISHING_DETAIL_ORDER = [
     'SalesRights',
     'ROWSalesRightsType',
     'SalesRestriction',
-    'PublishingDate',
     'PublicationDate',  # Added before CityOfPublication
     'CityOfPublication',
     'CountryOfPublication'
@@ -147,6 +161,236 @@ SUPPLY_DETAIL_ORDER = [
     'Price'
 ]
 
+# ONIX 2.1 Price children copied by copy_price as (2.1 tag, 3.0 tag), in ONIX
+# 3.0 order; CountryCode becomes the Territory that follows them
+PRICE_COPY_MAPPING = (
+    ('PriceTypeCode', 'PriceType'),
+    ('PriceAmount', 'PriceAmount'),
+    ('CurrencyCode', 'CurrencyCode'),
+)
+
+# ProductIDType codes for ISBN-13 ('15') and ISBN-10 ('02'); every product
+# needs at least one of them
+ISBN_ID_TYPES = frozenset({'15', '02'})
+
+# Product record fields copied unchanged from 2.1, in ONIX 3.0 order
+PRODUCT_RECORD_FIELDS = (
+    'RecordReference',
+    'NotificationType',
+    'RecordSourceType',
+    'RecordSourceName',
+)
+
+# SupplyDetail fields copied as (tag, default, required) rules: a present source
+# element is always copied; a missing one is only written when required
+SUPPLIER_FIELDS = (
+    ('SupplierRole', '01', True),
+    ('SupplierName', None, True),
+)
+RETURNS_CONDITIONS_FIELDS = (
+    ('ReturnsCodeType', None, True),
+    ('ReturnsCode', None, True),
+)
+SUPPLY_STATUS_FIELDS = (
+    ('ProductAvailability', '20', True),
+    ('PackQuantity', None, False),
+)
+
+# Publisher form prices as (country, publisher_data key, currency), checked in
+# order against a SupplyDetail's SupplyToCountry; the first match wins
+FORM_PRICE_FIELDS = (
+    ('CA', 'price_cad', 'CAD'),
+    ('GB', 'price_gbp', 'GBP'),
+    ('US', 'price_usd', 'USD'),
+)
+
+# Contributor element order for ONIX 3.0
+CONTRIBUTOR_ORDER = (
+    'SequenceNumber',
+    'ContributorRole',
+    'PersonName',
+    'PersonNameInverted',
+    'NamesBeforeKey',
+    'KeyNames',
+    'BiographicalNote',
+    'Website'
+)
+CONTRIBUTOR_ORDER_TAGS = frozenset(CONTRIBUTOR_ORDER)
+
+# Accessibility feature keywords (lowercase) and their codes, in match order
+ACCESSIBILITY_FEATURE_MAPPING = (
+    ('tableofcontents', '11'),
+    ('index', '12'),
+    ('readingorder', '13'),
+    ('alternativetext', '14'),
+    ('longdescription', '15'),
+    ('alternativerepresentation', '16'),
+    ('mathml', '17'),
+    ('chemml', '18'),
+    ('printpagenumbers', '19'),
+    ('pagenumbers', '19'),
+    ('pagebreaks', '19'),
+    ('synchronizedaudiotext', '20'),
+    ('ttsmarkup', '21'),
+    ('languagetagging', '22'),
+    ('displaytransformability', '24'),
+    ('fontcustomization', '24'),
+    ('textspacing', '24'),
+    ('colorcustomization', '24'),
+    ('texttospeech', '24'),
+    ('readingtools', '24'),
+    ('dyslexic', '24'),
+    ('highcontrast', '26'),
+    ('colorcontrast', '26'),
+    ('audiocontrast', '27'),
+    ('fullaudiodescription', '28'),
+    ('structuralnavigation', '29'),
+    ('aria', '30'),
+    ('accessibleinterface', '31'),
+    ('accessiblecontrols', '31'),
+    ('accessiblenavigation', '31'),
+    ('keyboard', '31'),
+    ('landmarks', '32'),
+    ('landmarknavigation', '32'),
+    ('chemistryml', '34'),
+    ('latex', '35'),
+    ('modifiabletextsize', '36'),
+    ('ultracolorcontrast', '37'),
+    ('glossary', '38'),
+    ('accessiblesupplementarycontent', '39'),
+    ('linkpurpose', '40'),
+    ('epub3', '2'),
+    ('wcaga', '80'),
+    ('wcagaa', '85'),
+    ('wcagaaa', '86')
+)
+
+# All feature keywords as one scan. The lookahead lets overlapping keywords
+# (e.g. 'pagenumbers' inside 'printpagenumbers') each produce a match; at any
+# one position the longest keyword wins and also reports the keywords that are
+# its prefixes ('wcagaaa' -> 'wcaga', 'wcagaa')
+_FEATURE_KEYS_LONGEST_FIRST = sorted({key for key, code in ACCESSIBILITY_FEATURE_MAPPING}, key=len, reverse=True)
+_FEATURE_GROUP_MATCHES = {
+    f'k{i}': tuple(pair for pair in ACCESSIBILITY_FEATURE_MAPPING if key.startswith(pair[0]))
+    for i, key in enumerate(_FEATURE_KEYS_LONGEST_FIRST)
+}
+_FEATURE_RE = re.compile('(?=' + '|'.join(
+    f'(?P<k{i}>{re.escape(key)})' for i, key in enumerate(_FEATURE_KEYS_LONGEST_FIRST)
+) + ')')
+
+# Keywords that mark enhanced rather than basic accessibility features
+ENHANCED_FEATURE_KEYWORDS = ('mathml', 'chemml', 'synchronized', 'fullaudio', 'latex')
+
+# Resource mode for each SupportingResource content type
+RESOURCE_MODE_MAPPING = {
+    '01': '04',  # websites are interactive
+    '04': '03',  # front cover is an image
+    '08': '03',  # product image is an image
+}
+
+# WCAG conformance feature codes (80-87) and descriptions
+WCAG_CONFORMANCE_FEATURES = {
+    '80': 'WCAG 2.1 Level A',
+    '81': 'WCAG 2.0 Level A',
+    '82': 'WCAG 2.0 Level AA',
+    '83': 'WCAG 2.0 Level AAA',
+    '84': 'WCAG 2.1 Level A',
+    '85': 'WCAG 2.1 Level AA',
+    '86': 'WCAG 2.1 Level AAA',
+    '87': 'WCAG 2.2'
+}
+
+# Access mode feature codes (50-52) and descriptions
+ACCESS_MODE_FEATURES = {
+    '50': 'Visual content',
+    '51': 'Audio enabled',
+    '52': 'Screen reader friendly'
+}
+
+# Enhanced feature codes (90-96) and descriptions
+ENHANCED_FEATURES = {
+    '90': 'Basic accessibility features',
+    '91': 'Enhanced accessibility features',
+    '92': 'Publisher accessibility documentation',
+    '93': 'Certification by trusted authority',
+    '94': 'Compliance documentation',
+    '95': 'Trusted intermediary',
+    '96': 'Trusted authority'
+}
+
+# Descriptions of ONIX accessibility feature codes
+FEATURE_DESCRIPTIONS = {
+    '00': 'No accessibility features',
+    '01': 'LIA Compliance Scheme',
+    '02': 'EPUB Basic Accessibility',
+    '03': 'EPUB Enhanced Accessibility',
+    '04': 'EPUB Accessibility 1.1',
+    '10': 'No reading system requirements',
+    '11': 'Table of contents navigation',
+    '12': 'Index navigation',
+    '13': 'Reading order',
+    '14': 'Short alternative descriptions',
+    '15': 'Full alternative descriptions',
+    '16': 'Supplementary content',
+    '17': 'MathML',
+    '18': 'ChemML',
+    '19': 'Print-equivalent page numbering',
+    '20': 'Synchronised pre-recorded audio',
+    '21': 'Text-to-speech hinting',
+    '22': 'Language tagging provided',
+    '24': 'Dyslexia readability',
+    '25': 'Use of ARIA roles',
+    '26': 'Use of high contrast between text and background color',
+    '27': 'Audio contrast',
+    '28': 'Full audio description',
+    '29': 'Enhanced navigation',
+    '30': 'ARIA markup',
+    '31': 'Accessible interface',
+    '32': 'Navigation using landmarks',
+    '34': 'Chemistry markup',
+    '35': 'LaTeX markup',
+    '36': 'Modifiable text size',
+    '37': 'Ultra high contrast',
+    '38': 'Glossary definitions',
+    '39': 'Accessible supplementary content',
+    '40': 'Link purpose indicators',
+    '50': 'Visual content',
+    '51': 'Audio enabled',
+    '52': 'Screen reader friendly',
+    '80': 'WCAG 2.1 Level A',
+    '81': 'WCAG 2.0 Level A',
+    '82': 'WCAG 2.0 Level AA',
+    '83': 'WCAG 2.0 Level AAA',
+    '84': 'WCAG 2.1 Level A',
+    '85': 'WCAG 2.1 Level AA',
+    '86': 'WCAG 2.1 Level AAA',
+    '90': 'Basic accessibility features',
+    '91': 'Enhanced accessibility features',
+    '92': 'Publisher accessibility documentation',
+    '93': 'Certification by trusted authority',
+    '94': 'Compliance documentation',
+    '95': 'Trusted intermediary',
+    '96': 'Trusted authority'
+}
+
+# (code, description) pairs for the EPUB conformance (1-4) and core (10-40)
+# features, resolved once instead of per product
+BASIC_CONFORMANCE_FEATURES = tuple((code, FEATURE_DESCRIPTIONS.get(code, '')) for code in ('1', '2', '3', '4'))
+CORE_FEATURES = tuple((str(code), FEATURE_DESCRIPTIONS.get(str(code), '')) for code in range(10, 41))
+
+# (position, code, description) for every code process_accessibility_features
+# writes after the summary: conformance, WCAG, core, access modes, enhanced
+FEATURE_EMISSION_ORDER = {
+    code: (position, code, description)
+    for position, (code, description) in enumerate((
+        *BASIC_CONFORMANCE_FEATURES,
+        *WCAG_CONFORMANCE_FEATURES.items(),
+        *CORE_FEATURES,
+        *ACCESS_MODE_FEATURES.items(),
+        *ENHANCED_FEATURES.items(),
+    ))
+}
+
 logger = logging.getLogger(__name__)
 
 def get_resource_mode(content_type):
@@ -156,12 +400,7 @@ def get_resource_mode(content_type):
     04 = front cover -> mode 03 (image)
     08 = product image -> mode 03 (image)
     """
-    mode_mapping = {
-        '01': '04',  # websites are interactive
-        '04': '03',  # front cover is an image
-        '08': '03',  # product image is an image
-    }
-    return mode_mapping.get(content_type, '03')  # default to '03' if not found
+    return RESOURCE_MODE_MAPPING.get(content_type, '03')  # default to '03' if not found
 
 def convert_onix2_to_onix3(root):
     """Convert ONIX 2.1 XML to ONIX 3.0"""
@@ -172,18 +411,19 @@ def convert_onix2_to_onix3(root):
     new_root.append(header)
     
     # Convert each Product
-    for product in root.findall('Product'):
+    for product in root.iterfind('Product'):
         new_product = etree.SubElement(new_root, 'Product')
+        children = index_children(product)
         
         # Convert basic elements
         for tag in ['RecordReference', 'NotificationType', 'RecordSourceType', 'RecordSourceName']:
-            elem = product.find(tag)
+            elem = first_child(children, tag)
             if elem is not None and elem.text:
                 new_elem = etree.SubElement(new_product, tag)
                 new_elem.text = elem.text
         
         # Convert ProductIdentifier elements
-        for pid in product.findall('ProductIdentifier'):
+        for pid in children.get('ProductIdentifier', ()):
             new_product.append(convert_product_identifier(pid))
             
         # Create DescriptiveDetail
@@ -218,9 +458,12 @@ def get_original_version(root):
         elif 'onix/2.1' in xmlns:
             return '2.1', True
     
-    header = root.find('Header') or root.find('header')
+    # One pass over the children per level, in any namespace. Elements must be
+    # tested against None: a childless <Release> is falsy, so `find() or find()`
+    # never returned it
+    header = next(root.iterchildren('{*}Header', '{*}header'), None)
     if header is not None:
-        release = header.find('Release') or header.find('release')
+        release = next(header.iterchildren('{*}Release', '{*}release'), None)
         if release is not None:
             return release.text, True
     
@@ -228,8 +471,7 @@ def get_original_version(root):
 
 def process_header(tree, new_root, original_version, publisher_data):
     """Process header information"""
-    # Add debug logging
-    print("DEBUG: Processing header with publisher data:", publisher_data)
+    logger.debug("Processing header with publisher data: %s", publisher_data)
     
     header = etree.SubElement(new_root, 'Header')
     
@@ -262,9 +504,10 @@ def process_header(tree, new_root, original_version, publisher_data):
 def create_text_content(old_text_element):
     """Create TextContent composite with correct element order"""
     text_content = etree.Element('TextContent')
+    old_children = index_children(old_text_element)
     
     # Add TextType first
-    type_code = old_text_element.find('TextTypeCode')
+    type_code = first_child(old_children, 'TextTypeCode')
     if type_code is not None:
         text_type = etree.SubElement(text_content, 'TextType')
         # Convert '99' to a valid code
@@ -278,19 +521,25 @@ def create_text_content(old_text_element):
     content_audience.text = '00'  # Unrestricted
     
     # Add Text content
-    text = old_text_element.find('Text')
+    text = first_child(old_children, 'Text')
     if text is not None:
-        new_text = etree.SubElement(text_content, 'Text')
-        new_text.text = text.text
+        add_text_element(text_content, 'Text', text.text)
         
     # Add source title if present
-    source_title = old_text_element.find('TextSourceTitle')
+    source_title = first_child(old_children, 'TextSourceTitle')
     if source_title is not None:
-        new_source = etree.SubElement(text_content, 'SourceTitle')
-        new_source.text = source_title.text
+        add_text_element(text_content, 'SourceTitle', source_title.text)
         
     return text_content
 
+def add_text_element(parent, tag, text):
+    """Append <tag>text</tag> to parent; nothing is created for missing or empty text"""
+    if not text:
+        return None
+    element = etree.SubElement(parent, tag)
+    element.text = text
+    return element
+
 def create_website_element(url=None, role=None, description=None):
     """Create a properly structured Website element"""
     website = etree.Element('Website')
@@ -324,68 +573,114 @@ def create_price_composite(price_element):
         currency.text = 'USD'  # Default to USD
     
     price = etree.Element('Price')
+    old_children = index_children(price_element)
     
     # Process elements in correct order
     for element_name in PRICE_ELEMENT_ORDER:
         if element_name == 'PriceType':
-            type_code = price_element.find('PriceTypeCode')
+            type_code = first_child(old_children, 'PriceTypeCode')
             if type_code is not None:
                 price_type = etree.SubElement(price, 'PriceType')
                 price_type.text = type_code.text
                 
         elif element_name == 'Territory':
-            country_code = price_element.find('CountryCode')
+            country_code = first_child(old_children, 'CountryCode')
             if country_code is not None:
                 territory = etree.SubElement(price, 'Territory')
                 countries = etree.SubElement(territory, 'CountriesIncluded')
                 countries.text = country_code.text
                 
         elif element_name in ['TaxType', 'TaxRatePercent', 'TaxableAmount', 'TaxAmount']:
-            old_element = price_element.find(element_name.replace('Tax', 'Tax1'))
+            old_element = first_child(old_children, element_name.replace('Tax', 'Tax1'))
             if old_element is not None:
                 new_element = etree.SubElement(price, element_name)
                 new_element.text = old_element.text
                 
         else:
-            element = price_element.find(element_name)
+            element = first_child(old_children, element_name)
             if element is not None:
                 new_element = etree.SubElement(price, element_name)
                 new_element.text = element.text
     
     return price
 
+def local_name(tag):
+    """Strip the {namespace} prefix from a Clark-notation tag without building a QName"""
+    return tag.rpartition('}')[2] if tag[0] == '{' else tag
+
+def index_children(element):
+    """Group the direct children of an element by tag, keeping document order"""
+    children = {}
+    for child in element:
+        children.setdefault(child.tag, []).append(child)
+    return children
+
+def find_descendant(element, tag):
+    """Equivalent of element.find('.//' + tag), walking the tree in C without a path"""
+    return next(element.iterdescendants(tag), None)
+
+def first_child(children, tag):
+    """First child with the given tag from an index_children() mapping, or None"""
+    matches = children.get(tag)
+    return matches[0] if matches else None
+
+def copy_child_element(parent, children, tag):
+    """Copy the first child with the given tag from an index_children() mapping, text included"""
+    source = first_child(children, tag)
+    if source is not None:
+        etree.SubElement(parent, tag).text = source.text
+
+def child_text(children, tag, default=None):
+    """Equivalent of element.findtext(tag, default) on an index_children() mapping"""
+    child = first_child(children, tag)
+    if child is None:
+        return default
+    return child.text or ''
+
+def order_positions(order_list):
+    """Map each tag in an order list to its first position, as order_list.index() would"""
+    positions = {}
+    for position, tag in enumerate(order_list):
+        positions.setdefault(tag, position)
+    return positions
+
+# Position lookups for the module's order lists, keyed by list identity
+_ORDER_POSITIONS = {
+    id(order_list): order_positions(order_list)
+    for order_list in (DESCRIPTIVE_DETAIL_ORDER, PUBLISHING_DETAIL_ORDER, TEXT_CONTENT_ORDER,
+                       PRICE_ELEMENT_ORDER, SUPPLY_DETAIL_ORDER)
+}
+
+def get_order_positions(order_list):
+    """Return the tag -> position mapping for an order list, precomputed for the module's lists"""
+    positions = _ORDER_POSITIONS.get(id(order_list))
+    return positions if positions is not None else order_positions(order_list)
+
 def create_ordered_subelement(parent, tag_name, order_list=None):
     """Create a subelement in the correct order based on the provided order list"""
     if order_list is None:
         return etree.SubElement(parent, tag_name)
     
     # Find the position where this element should be inserted
-    target_index = order_list.index(tag_name) if tag_name in order_list else len(order_list)
-    
-    # Find the first existing element that should come after our new element
-    insert_before = None
-    for child in parent:
-        child_tag = etree.QName(child).localname
-        if child_tag in order_list:
-            child_index = order_list.index(child_tag)
-            if child_index > target_index:
-                insert_before = child
-                break
-    
-    # Create and insert the new element
-    if insert_before is not None:
-        new_element = etree.Element(tag_name)
-        parent.insert(parent.index(insert_before), new_element)
-    else:
-        new_element = etree.SubElement(parent, tag_name)
-    
-    return new_element
+    positions = get_order_positions(order_list)
+    target_index = positions.get(tag_name, len(order_list))
+    
+    # Insert before the first existing element that should come after the new one
+    for index, child in enumerate(parent):
+        child_index = positions.get(local_name(child.tag))
+        if child_index is not None and child_index > target_index:
+            new_element = etree.Element(tag_name)
+            parent.insert(index, new_element)
+            return new_element
+    
+    return etree.SubElement(parent, tag_name)
 def process_elements_in_order(parent_element, old_product, order_list, handler_functions=None):
     """Process elements in strict order"""
     if handler_functions is None:
         handler_functions = {}
         
     processed_elements = set()
+    children = index_children(old_product)
     
     for element_name in order_list:
         # Skip if already processed (handles duplicates in order list)
@@ -397,7 +692,7 @@ def process_elements_in_order(parent_element, old_product, order_list, handler_f
             handler_functions[element_name](parent_element, old_product)
         else:
             # Standard element processing
-            for element in old_product.findall(element_name):
+            for element in children.get(element_name, ()):
                 new_element = etree.SubElement(parent_element, element_name)
                 for child in element:
                     etree.SubElement(new_element, child.tag).text = child.text
@@ -435,7 +730,7 @@ def create_measures(parent, old_product):
         3: '08'   # Weight
     }
     
-    for i, measure in enumerate(old_product.findall('Measure')):
+    for i, measure in enumerate(old_product.iterfind('Measure')):
         new_measure = etree.SubElement(parent, 'Measure')
         
         # Use different measure types for each dimension
@@ -454,24 +749,14 @@ def create_measures(parent, old_product):
 
 def create_contributor(parent, old_contributor):
     """Create Contributor elements with proper name identifier structure"""
-    new_contributor = etree.Element('Contributor')
-    
-    # Define the correct order of elements for ONIX 3.0
-    element_order = [
-        'SequenceNumber',
-        'ContributorRole',
-        'PersonName',
-        'PersonNameInverted', 
-        'NamesBeforeKey',
-        'KeyNames',
-        'BiographicalNote',
-        'Website'
-    ]
+    new_contributor = etree.SubElement(parent, 'Contributor')
     
     # Create a temporary dictionary to store elements
     elements = {}
     
-    # Process each child element
+    # Process each child element; anything not in CONTRIBUTOR_ORDER (including
+    # PersonNameIdentifier, NameIdentifier and CountryCode) would be dropped, so
+    # it is not rebuilt at all
     for child in old_contributor:
         if child.tag == 'Website':
             website = etree.Element('Website')
@@ -483,14 +768,14 @@ def create_contributor(parent, old_contributor):
                     link = etree.SubElement(website, 'WebsiteLink')
                     link.text = web_child.text
             elements['Website'] = website
-        elif child.tag not in ['PersonNameIdentifier', 'NameIdentifier', 'CountryCode']:  # Skip invalid elements
+        elif child.tag in CONTRIBUTOR_ORDER_TAGS:
             if child.text:  # Only create element if there's content
                 new_child = etree.Element(child.tag)
                 new_child.text = child.text
                 elements[child.tag] = new_child
     
     # Add elements in the correct order
-    for tag in element_order:
+    for tag in CONTRIBUTOR_ORDER:
         if tag in elements:
             new_contributor.append(elements[tag])
     
@@ -503,14 +788,13 @@ def create_publishing_status(parent, old_product):
 
 def create_sales_rights(parent, old_product):
     """Create SalesRights with proper territory structure"""
-    for rights in old_product.findall('SalesRights'):
+    for rights in old_product.iterfind('SalesRights'):
         new_rights = etree.SubElement(parent, 'SalesRights')
         
         # Add SalesRightsType first
         rights_type = rights.find('SalesRightsType')
         if rights_type is not None:
-            new_type = etree.SubElement(new_rights, 'SalesRightsType')
-            new_type.text = rights_type.text
+            add_text_element(new_rights, 'SalesRightsType', rights_type.text)
             
         # Handle territory information
         rights_territory = rights.find('RightsTerritory')
@@ -530,6 +814,27 @@ def create_supply_territory(countries_text):
         regions.text = 'WORLD'
     return territory
 
+# Prebuilt Market Territory composites keyed by the joined SupplyToCountry text
+# (None for WORLD). Feeds repeat the same few country lists, but the text comes
+# from the input, so only the first TERRITORY_CACHE_SIZE lists are kept
+TERRITORY_CACHE_SIZE = 64
+_TERRITORY_TEMPLATES = {}
+
+def create_market_territory(countries_text):
+    """Return a Territory listing countries_text, or WORLD when it is None"""
+    template = _TERRITORY_TEMPLATES.get(countries_text)
+    if template is None:
+        template = etree.Element('Territory')
+        if countries_text is not None:
+            countries = etree.SubElement(template, 'CountriesIncluded')
+            countries.text = countries_text
+        else:
+            regions = etree.SubElement(template, 'RegionsIncluded')
+            regions.text = 'WORLD'
+        if len(_TERRITORY_TEMPLATES) < TERRITORY_CACHE_SIZE:
+            _TERRITORY_TEMPLATES[countries_text] = template
+    return copy.deepcopy(template)
+
 def handle_website_element(parent):
     """Handle empty or invalid Website elements"""
     website = parent.find('Website')
@@ -549,19 +854,19 @@ def create_measure(parent, old_measure, measure_type):
     # Add Measurement
     measurement = old_measure.find('Measurement')
     if measurement is not None:
-        new_measurement = etree.SubElement(new_measure, 'Measurement')
-        new_measurement.text = measurement.text
+        add_text_element(new_measure, 'Measurement', measurement.text)
         
     # Add MeasureUnitCode
     unit_code = old_measure.find('MeasureUnitCode')
     if unit_code is not None:
-        new_unit = etree.SubElement(new_measure, 'MeasureUnitCode')
-        new_unit.text = unit_code.text
+        add_text_element(new_measure, 'MeasureUnitCode', unit_code.text)
     
     return new_measure
 
-def create_title_element(old_product):
+def create_title_element(old_product, children=None):
     """Create properly structured TitleDetail element"""
+    if children is None:
+        children = index_children(old_product)
     title_detail = etree.Element('TitleDetail')
     
     # Add TitleType
@@ -580,100 +885,50 @@ def create_title_element(old_product):
     level.text = '01'  # Product level
     
     # Get title from old product
-    old_title = old_product.find('Title')
+    old_title = first_child(children, 'Title')
     if old_title is not None:
         # Add TitleText
         title_text = old_title.find('TitleText')
-        if title_text is not None and title_text.text:
-            new_title_text = etree.SubElement(title_element, 'TitleText')
-            new_title_text.text = title_text.text
+        if title_text is not None:
+            add_text_element(title_element, 'TitleText', title_text.text)
         
         # Add Subtitle if present
         subtitle = old_title.find('Subtitle')
-        if subtitle is not None and subtitle.text:
-            new_subtitle = etree.SubElement(title_element, 'Subtitle')
-            new_subtitle.text = subtitle.text
+        if subtitle is not None:
+            add_text_element(title_element, 'Subtitle', subtitle.text)
     else:
         # Fallback to TitleText directly under Product
-        title_text = old_product.find('TitleText')
-        if title_text is not None and title_text.text:
-            new_title_text = etree.SubElement(title_element, 'TitleText')
-            new_title_text.text = title_text.text
+        title_text = first_child(children, 'TitleText')
+        if title_text is not None:
+            add_text_element(title_element, 'TitleText', title_text.text)
     
     return title_detail
 
 def analyze_accessibility_features(value, accessibility_info):
     """Analyze accessibility features from metadata"""
-    # Basic feature mapping
-    feature_mapping = {
-        'tableofcontents': '11',
-        'index': '12',
-        'readingorder': '13',
-        'alternativetext': '14',
-        'longdescription': '15',
-        'alternativerepresentation': '16',
-        'mathml': '17',
-        'chemml': '18',
-        'printpagenumbers': '19',
-        'pagenumbers': '19',
-        'pagebreaks': '19',
-        'synchronizedaudiotext': '20',
-        'ttsmarkup': '21',
-        'languagetagging': '22',
-        'displaytransformability': '24',
-        'fontcustomization': '24',
-        'textspacing': '24',
-        'colorcustomization': '24',
-        'texttospeech': '24',
-        'readingtools': '24',
-        'dyslexic': '24',
-        'highcontrast': '26',
-        'colorcontrast': '26',
-        'audiocontrast': '27',
-        'fullaudiodescription': '28',
-        'structuralnavigation': '29',
-        'aria': '30',
-        'accessibleinterface': '31',
-        'accessiblecontrols': '31',
-        'accessiblenavigation': '31',
-        'keyboard': '31',
-        'landmarks': '32',
-        'landmarknavigation': '32',
-        'chemistryml': '34',
-        'latex': '35',
-        'modifiabletextsize': '36',
-        'ultracolorcontrast': '37',
-        'glossary': '38',
-        'accessiblesupplementarycontent': '39',
-        'linkpurpose': '40',
-        'epub3': '2',
-        'wcaga': '80',
-        'wcagaa': '85',
-        'wcagaaa': '86'
-    }
+    value = value.lower()
     
-    for key, code in feature_mapping.items():
-        if key.lower() in value.lower():
+    for match in _FEATURE_RE.finditer(value):
+        for key, code in _FEATURE_GROUP_MATCHES[match.lastgroup]:
             accessibility_info[code] = True
-            logger.info(f"Accessibility feature detected: {key}")
+            logger.info("Accessibility feature detected: %s", key)
     
     # Add compliance and conformance flags
-    if 'epub3' in value.lower():
+    if 'epub3' in value:
         accessibility_info['2'] = True  # EPUB 3
         accessibility_info['3'] = True  # EPUB 3 with accessibility features
         accessibility_info['4'] = True  # EPUB Accessibility 1.1 compliant
         
-    if 'wcag2.1' in value.lower() or 'wcag 2.1' in value.lower():
-        if 'aaa' in value.lower():
+    if 'wcag2.1' in value or 'wcag 2.1' in value:
+        if 'aaa' in value:
             accessibility_info['86'] = True  # WCAG 2.1 Level AAA
-        elif 'aa' in value.lower():
+        elif 'aa' in value:
             accessibility_info['85'] = True  # WCAG 2.1 Level AA
         else:
             accessibility_info['80'] = True  # WCAG 2.1 Level A
             
     # Check for basic vs enhanced features
-    enhanced_features = ['mathml', 'chemml', 'synchronized', 'fullaudio', 'latex']
-    has_enhanced = any(feature in value.lower() for feature in enhanced_features)
+    has_enhanced = any(feature in value for feature in ENHANCED_FEATURE_KEYWORDS)
     if has_enhanced:
         accessibility_info['91'] = True  # Enhanced accessibility features
     else:
@@ -699,7 +954,7 @@ def analyze_additional_metadata(property, value, accessibility_info):
         logger.info("Compliance certification detected")
     
     if ('accessibilityapi' in property or 
-        'a11y:certifierReport' in property or 
+        'a11y:certifierreport' in property or 
         ('accessibility' in property and value.startswith('http'))):
         accessibility_info['94'] = True  # Compliance web page available
         logger.info(f"Compliance web page detected: {value}")
@@ -718,13 +973,13 @@ def analyze_additional_metadata(property, value, accessibility_info):
             
     # EPUB-specific metadata
     if 'schema:accessibilityfeature' in property:
-        if 'structuralNavigation' in value:
+        if 'structuralnavigation' in value:
             accessibility_info['29'] = True
-        if 'displayTransformability' in value:
+        if 'displaytransformability' in value:
             accessibility_info['24'] = True
-        if 'readingOrder' in value:
+        if 'readingorder' in value:
             accessibility_info['13'] = True
-        if 'printPageNumbers' in value:
+        if 'printpagenumbers' in value:
             accessibility_info['19'] = True
             
     # Additional accessibility properties
@@ -747,60 +1002,7 @@ def analyze_additional_metadata(property, value, accessibility_info):
                     accessibility_info['80'] = True
 def get_feature_description(code):
     """Get description for specific accessibility features"""
-    descriptions = {
-        '00': 'No accessibility features',
-        '01': 'LIA Compliance Scheme',
-        '02': 'EPUB Basic Accessibility',
-        '03': 'EPUB Enhanced Accessibility',
-        '04': 'EPUB Accessibility 1.1',
-        '10': 'No reading system requirements',
-        '11': 'Table of contents navigation',
-        '12': 'Index navigation',
-        '13': 'Reading order',
-        '14': 'Short alternative descriptions',
-        '15': 'Full alternative descriptions',
-        '16': 'Supplementary content',
-        '17': 'MathML',
-        '18': 'ChemML',
-        '19': 'Print-equivalent page numbering',
-        '20': 'Synchronised pre-recorded audio',
-        '21': 'Text-to-speech hinting',
-        '22': 'Language tagging provided',
-        '24': 'Dyslexia readability',
-        '25': 'Use of ARIA roles',
-        '26': 'Use of high contrast between text and background color',
-        '27': 'Audio contrast',
-        '28': 'Full audio description',
-        '29': 'Enhanced navigation',
-        '30': 'ARIA markup',
-        '31': 'Accessible interface',
-        '32': 'Navigation using landmarks',
-        '34': 'Chemistry markup',
-        '35': 'LaTeX markup',
-        '36': 'Modifiable text size',
-        '37': 'Ultra high contrast',
-        '38': 'Glossary definitions',
-        '39': 'Accessible supplementary content',
-        '40': 'Link purpose indicators',
-        '50': 'Visual content',
-        '51': 'Audio enabled',
-        '52': 'Screen reader friendly',
-        '80': 'WCAG 2.1 Level A',
-        '81': 'WCAG 2.0 Level A',
-        '82': 'WCAG 2.0 Level AA',
-        '83': 'WCAG 2.0 Level AAA',
-        '84': 'WCAG 2.1 Level A',
-        '85': 'WCAG 2.1 Level AA',
-        '86': 'WCAG 2.1 Level AAA',
-        '90': 'Basic accessibility features',
-        '91': 'Enhanced accessibility features',
-        '92': 'Publisher accessibility documentation',
-        '93': 'Certification by trusted authority',
-        '94': 'Compliance documentation',
-        '95': 'Trusted intermediary',
-        '96': 'Trusted authority'
-    }
-    return descriptions.get(code, '')
+    return FEATURE_DESCRIPTIONS.get(code, '')
 
 def generate_accessibility_summary(features):
     """Generate comprehensive accessibility summary"""
@@ -817,6 +1019,27 @@ def generate_accessibility_summary(features):
         
     return ". ".join(summary_parts) + "." if summary_parts else "Basic accessibility features supported"
 
+# Prebuilt ProductFormFeature composites keyed by (code, description). Codes and
+# descriptions all come from the fixed tables above (or the handful of summaries
+# generate_accessibility_summary can produce), so the cache stays small
+_FEATURE_TEMPLATES = {}
+
+def add_accessibility_feature(descriptive_detail, code, description):
+    """Append a ProductFormFeature of type 09 (accessibility) for the given code"""
+    template = _FEATURE_TEMPLATES.get((code, description))
+    if template is None:
+        template = etree.Element('ProductFormFeature')
+        feature_type = etree.SubElement(template, 'ProductFormFeatureType')
+        feature_type.text = '09'
+        value = etree.SubElement(template, 'ProductFormFeatureValue')
+        value.text = code
+        add_text_element(template, 'ProductFormFeatureDescription', description)
+        _FEATURE_TEMPLATES[(code, description)] = template
+    
+    feature = copy.deepcopy(template)
+    descriptive_detail.append(feature)
+    return feature
+
 def process_accessibility_features(descriptive_detail, epub_features):
     """Process accessibility features into ProductFormFeature composites"""
     if not epub_features:
@@ -832,98 +1055,27 @@ def process_accessibility_features(descriptive_detail, epub_features):
     
     # Add summary first if present
     if epub_features.get('0'):
-        summary = etree.SubElement(descriptive_detail, 'ProductFormFeature')
-        feature_type = etree.SubElement(summary, 'ProductFormFeatureType')
-        feature_type.text = '09'
-        value = etree.SubElement(summary, 'ProductFormFeatureValue')
-        value.text = '0'
-        desc = etree.SubElement(summary, 'ProductFormFeatureDescription')
-        desc.text = generate_accessibility_summary(epub_features)
-    
-    # Process EPUB and basic accessibility conformance
-    basic_conformance = ['1', '2', '3', '4']
-    for code in basic_conformance:
-        if epub_features.get(code):
-            feature = etree.SubElement(descriptive_detail, 'ProductFormFeature')
-            feature_type = etree.SubElement(feature, 'ProductFormFeatureType')
-            feature_type.text = '09'
-            value = etree.SubElement(feature, 'ProductFormFeatureValue')
-            value.text = code
-            description = get_feature_description(code)
-            if description:
-                desc = etree.SubElement(feature, 'ProductFormFeatureDescription')
-                desc.text = description
-    
-    # Process WCAG conformance levels
-    wcag_codes = {
-        '80': 'WCAG 2.1 Level A',
-        '81': 'WCAG 2.0 Level A',
-        '82': 'WCAG 2.0 Level AA',
-        '83': 'WCAG 2.0 Level AAA',
-        '84': 'WCAG 2.1 Level A',
-        '85': 'WCAG 2.1 Level AA',
-        '86': 'WCAG 2.1 Level AAA',
-        '87': 'WCAG 2.2'
-    }
-    for code, desc_text in wcag_codes.items():
-        if epub_features.get(code):
-            feature = etree.SubElement(descriptive_detail, 'ProductFormFeature')
-            feature_type = etree.SubElement(feature, 'ProductFormFeatureType')
-            feature_type.text = '09'
-            value = etree.SubElement(feature, 'ProductFormFeatureValue')
-            value.text = code
-            desc = etree.SubElement(feature, 'ProductFormFeatureDescription')
-            desc.text = desc_text
-    
-    # Process core features (10-40)
-    for code in range(10, 41):
-        str_code = str(code)
-        if epub_features.get(str_code):
-            feature = etree.SubElement(descriptive_detail, 'ProductFormFeature')
-            feature_type = etree.SubElement(feature, 'ProductFormFeatureType')
-            feature_type.text = '09'
-            value = etree.SubElement(feature, 'ProductFormFeatureValue')
-            value.text = str_code
-            description = get_feature_description(str_code)
-            if description:
-                desc = etree.SubElement(feature, 'ProductFormFeatureDescription')
-                desc.text = description
-    
-    # Process access modes (50-52)
-    access_modes = {
-        '50': 'Visual content',
-        '51': 'Audio enabled',
-        '52': 'Screen reader friendly'
-    }
-    for code, desc_text in access_modes.items():
-        if epub_features.get(code):
-            feature = etree.SubElement(descriptive_detail, 'ProductFormFeature')
-            feature_type = etree.SubElement(feature, 'ProductFormFeatureType')
-            feature_type.text = '09'
-            value = etree.SubElement(feature, 'ProductFormFeatureValue')
-            value.text = code
-            desc = etree.SubElement(feature, 'ProductFormFeatureDescription')
-            desc.text = desc_text
-    
-    # Process enhanced features (90-96)
-    enhanced_features = {
-        '90': 'Basic accessibility features',
-        '91': 'Enhanced accessibility features',
-        '92': 'Publisher accessibility documentation',
-        '93': 'Certification by trusted authority',
-        '94': 'Compliance documentation',
-        '95': 'Trusted intermediary',
-        '96': 'Trusted authority'
-    }
-    for code, desc_text in enhanced_features.items():
-        if epub_features.get(code):
-            feature = etree.SubElement(descriptive_detail, 'ProductFormFeature')
-            feature_type = etree.SubElement(feature, 'ProductFormFeatureType')
-            feature_type.text = '09'
-            value = etree.SubElement(feature, 'ProductFormFeatureValue')
-            value.text = code
-            desc = etree.SubElement(feature, 'ProductFormFeatureDescription')
-            desc.text = desc_text
+        add_accessibility_feature(descriptive_detail, '0', generate_accessibility_summary(epub_features))
+    
+    # Walk only the features that are set, then emit them in group order
+    entries = sorted(
+        FEATURE_EMISSION_ORDER[code]
+        for code, present in epub_features.items()
+        if present and code in FEATURE_EMISSION_ORDER
+    )
+    for position, code, description in entries:
+        add_accessibility_feature(descriptive_detail, code, description)
+
+def build_accessibility_features(epub_features):
+    """
+    Build the accessibility ProductFormFeature composites once per document.
+    epub_features is the same for every product, so process_onix builds them
+    here and each DescriptiveDetail takes the children of a deep copy.
+    """
+    wrapper = etree.Element('ProductFormFeatures')
+    if epub_features:
+        process_accessibility_features(wrapper, epub_features)
+    return wrapper
 
 def convert_header(old_header):
     """Convert Header from ONIX 2.1 to 3.0"""
@@ -990,35 +1142,10 @@ def convert_product_identifier(old_identifier, existing_identifiers=None):
     
     return None
 
-def create_descriptive_detail(old_product, epub_features, publisher_data=None):
-    """Create DescriptiveDetail composite with proper element order"""
+def build_descriptive_detail_middle():
+    """Build the constant DescriptiveDetail elements from ProductPackaging to MapScale"""
     descriptive_detail = etree.Element('DescriptiveDetail')
     
-    # 1. ProductComposition
-    composition = etree.SubElement(descriptive_detail, 'ProductComposition')
-    composition.text = publisher_data.get('product_composition', '00') if publisher_data else '00'
-    
-    # 2. ProductForm 
-    form = etree.SubElement(descriptive_detail, 'ProductForm')
-    old_form = old_product.find('ProductForm')
-    form.text = old_form.text if old_form is not None else 'BC'
-    
-    # 3. ProductFormDetail
-    old_form_detail = old_product.find('ProductFormDetail')
-    if old_form_detail is not None:
-        form_detail = etree.SubElement(descriptive_detail, 'ProductFormDetail')
-        form_detail.text = old_form_detail.text
-    
-    # 4. ProductFormFeature
-    for old_feature in old_product.findall('ProductFormFeature'):
-        feature = etree.SubElement(descriptive_detail, 'ProductFormFeature')
-        for child in old_feature:
-            etree.SubElement(feature, child.tag).text = child.text
-            
-    # 5. Add accessibility features
-    if epub_features:
-        process_accessibility_features(descriptive_detail, epub_features)
-    
     # 6. ProductPackaging
     packaging = etree.SubElement(descriptive_detail, 'ProductPackaging')
     packaging.text = '00'
@@ -1068,22 +1195,62 @@ def create_descriptive_detail(old_product, epub_features, publisher_data=None):
     scale = etree.SubElement(descriptive_detail, 'MapScale')
     scale.text = '1000000'
     
+    return descriptive_detail
+
+# Built once; create_descriptive_detail moves the children of a deep copy into
+# each product instead of rebuilding them
+_DESCRIPTIVE_DETAIL_MIDDLE = build_descriptive_detail_middle()
+
+def create_descriptive_detail(old_product, epub_features, publisher_data=None, children=None,
+                              accessibility_features=None):
+    """Create DescriptiveDetail composite with proper element order"""
+    if children is None:
+        children = index_children(old_product)
+    descriptive_detail = etree.Element('DescriptiveDetail')
+    
+    # 1. ProductComposition
+    composition = etree.SubElement(descriptive_detail, 'ProductComposition')
+    composition.text = publisher_data.get('product_composition', '00') if publisher_data else '00'
+    
+    # 2. ProductForm 
+    form = etree.SubElement(descriptive_detail, 'ProductForm')
+    old_form = first_child(children, 'ProductForm')
+    form.text = old_form.text if old_form is not None else 'BC'
+    
+    # 3. ProductFormDetail
+    old_form_detail = first_child(children, 'ProductFormDetail')
+    if old_form_detail is not None:
+        form_detail = etree.SubElement(descriptive_detail, 'ProductFormDetail')
+        form_detail.text = old_form_detail.text
+    
+    # 4. ProductFormFeature (same layout in 2.1 and 3.0, so copied as is)
+    for old_feature in children.get('ProductFormFeature', ()):
+        descriptive_detail.append(copy.deepcopy(old_feature))
+            
+    # 5. Add accessibility features
+    if accessibility_features is not None:
+        descriptive_detail.extend(copy.deepcopy(accessibility_features))
+    elif epub_features:
+        process_accessibility_features(descriptive_detail, epub_features)
+    
+    # 6-15. ProductPackaging through MapScale are the same for every product
+    descriptive_detail.extend(copy.deepcopy(_DESCRIPTIVE_DETAIL_MIDDLE))
+    
     # 16. TitleDetail
-    title_detail = create_title_element(old_product)
+    title_detail = create_title_element(old_product, children)
     if title_detail is not None:
         descriptive_detail.append(title_detail)
     
     # 17. Contributors (moved here after TitleDetail)
-    for contributor in old_product.findall('Contributor'):
-        new_contributor = create_contributor(descriptive_detail, contributor)
-        descriptive_detail.append(new_contributor)
+    for contributor in children.get('Contributor', ()):
+        create_contributor(descriptive_detail, contributor)
     
     # 18. NoEdition
-    if not old_product.find('Edition'):
+    if not first_child(children, 'Edition'):
         etree.SubElement(descriptive_detail, 'NoEdition')
     
     # 19. Language
-    old_language = old_product.find('Language')
+    old_language = first_child(children, 'Language')
     if old_language is not None:
         language = etree.SubElement(descriptive_detail, 'Language')
         language_role = etree.SubElement(language, 'LanguageRole')
@@ -1092,19 +1259,18 @@ def create_descriptive_detail(old_product, epub_features, publisher_data=None):
         language_code.text = 'eng'
     
     # 20. Extent
-    old_extent = old_product.find('Extent')
+    old_extent = first_child(children, 'Extent')
     if old_extent is not None:
         extent = etree.SubElement(descriptive_detail, 'Extent')
         extent_type = etree.SubElement(extent, 'ExtentType')
         extent_type.text = old_extent.findtext('ExtentType', '02')
         extent_value = etree.SubElement(extent, 'ExtentValue')
-        extent_value.text = old_product.findtext('NumberOfPages', '320')
+        extent_value.text = child_text(children, 'NumberOfPages', '320')
         extent_unit = etree.SubElement(extent, 'ExtentUnit')
         extent_unit.text = '03'
     
     # 21. Convert Illustrations to AncillaryContent
-    illustrations = old_product.findall('.//Illustrations')
-    for illustration in illustrations:
+    for illustration in old_product.iter('Illustrations'):
         illus_type = illustration.find('IllustrationType')
         illus_number = illustration.find('Number')
         illus_desc = illustration.find('IllustrationTypeDescription')
@@ -1131,7 +1297,7 @@ def create_descriptive_detail(old_product, epub_features, publisher_data=None):
             description.text = illus_desc.text
     
     # 22. Subject
-    for subject in old_product.findall('Subject'):
+    for subject in children.get('Subject', ()):
         descriptive_detail.append(copy.deepcopy(subject))
     
     # 23. AudienceCode
@@ -1140,25 +1306,29 @@ def create_descriptive_detail(old_product, epub_features, publisher_data=None):
     
     return descriptive_detail
 
-def create_collateral_detail(old_product):
+def create_collateral_detail(old_product, children=None):
     """Create CollateralDetail composite"""
+    if children is None:
+        children = index_children(old_product)
     collateral_detail = etree.Element('CollateralDetail')
     
     # Convert OtherText elements to TextContent with correct order
-    for text_element in old_product.findall('OtherText'):
+    for text_element in children.get('OtherText', ()):
         text_content = create_text_content(text_element)
         collateral_detail.append(text_content)
     
     # Convert MediaFile elements to SupportingResource
-    for media_element in old_product.findall('MediaFile'):
+    for media_element in children.get('MediaFile', ()):
+        media_children = index_children(media_element)
+        
         # Check URL before creating resource
-        link = media_element.find('MediaFileLink')
+        link = first_child(media_children, 'MediaFileLink')
         url = link.text if link is not None else None
             
         resource = etree.SubElement(collateral_detail, 'SupportingResource')
         
         # Add ResourceContentType first
-        type_code = media_element.find('MediaFileTypeCode')
+        type_code = first_child(media_children, 'MediaFileTypeCode')
         if type_code is not None:
             # 1. ResourceContentType must be first
             content_type = etree.SubElement(resource, 'ResourceContentType')
@@ -1182,7 +1352,7 @@ def create_collateral_detail(old_product):
         resource_form.text = '01'
         
         # Add version feature and link
-        link_type = media_element.find('MediaFileLinkTypeCode')
+        link_type = first_child(media_children, 'MediaFileLinkTypeCode')
         
         if link_type is not None:
             feature = etree.SubElement(version, 'ResourceVersionFeature')
@@ -1194,7 +1364,7 @@ def create_collateral_detail(old_product):
             resource_link.text = url
             
         # Add content date if present
-        date = media_element.find('MediaFileDate')
+        date = first_child(media_children, 'MediaFileDate')
         if date is not None:
             content_date = etree.SubElement(version, 'ContentDate')
             date_role = etree.SubElement(content_date, 'ContentDateRole')
@@ -1203,7 +1373,7 @@ def create_collateral_detail(old_product):
             date_value.text = date.text
     
     # Process ProductWebsite elements into SupportingResource
-    for website in old_product.findall('ProductWebsite'):
+    for website in children.get('ProductWebsite', ()):
         # Check URL before creating resource
         link = website.find('ProductWebsiteLink')
         url = link.text if link is not None else None
@@ -1240,41 +1410,10 @@ def create_collateral_detail(old_product):
     
     return collateral_detail
 
-def create_publishing_detail(old_product):
-    """Create PublishingDetail composite with correct element order"""
+def build_publishing_detail_tail():
+    """Build the constant PublishingDetail elements that follow PublishingStatus"""
     publishing_detail = etree.Element('PublishingDetail')
     
-    # 1. Imprint (MUST BE FIRST)
-    imprint = old_product.find('Imprint')
-    if imprint is not None:
-        new_imprint = etree.SubElement(publishing_detail, 'Imprint')
-        imprint_name = etree.SubElement(new_imprint, 'ImprintName')
-        imprint_name.text = imprint.findtext('ImprintName')
-
-    # 2. Publisher with Website
-    publisher = old_product.find('Publisher')
-    if publisher is not None:
-        new_publisher = etree.SubElement(publishing_detail, 'Publisher')
-        
-        # Add PublishingRole first
-        pub_role = etree.SubElement(new_publisher, 'PublishingRole')
-        pub_role.text = publisher.findtext('PublishingRole', '01')
-        
-        # Add PublisherName
-        pub_name = etree.SubElement(new_publisher, 'PublisherName')
-        pub_name.text = publisher.findtext('PublisherName')
-        
-        # Add Website within Publisher
-        website = etree.SubElement(new_publisher, 'Website')
-        website_role = etree.SubElement(website, 'WebsiteRole')
-        website_role.text = '01'
-        website_link = etree.SubElement(website, 'WebsiteLink')
-        website_link.text = 'http://www.dundurn.com'
-
-    # 3. PublishingStatus
-    status = etree.SubElement(publishing_detail, 'PublishingStatus')
-    status.text = old_product.findtext('PublishingStatus', '02')
-
     # 4. Publishing Date
     pub_date = etree.SubElement(publishing_detail, 'PublishingDate')
     date_role = etree.SubElement(pub_date, 'PublishingDateRole')
@@ -1309,12 +1448,58 @@ def create_publishing_detail(old_product):
 
     return publishing_detail
 
-def create_related_material(old_product):
+# Built once; create_publishing_detail appends deep copies to each product,
+# which is several times faster than rebuilding them
+_PUBLISHING_DETAIL_TAIL = build_publishing_detail_tail()
+_PUBLISHER_WEBSITE = create_website_element('http://www.dundurn.com')
+
+def create_publishing_detail(old_product, children=None):
+    """Create PublishingDetail composite with correct element order"""
+    if children is None:
+        children = index_children(old_product)
+    publishing_detail = etree.Element('PublishingDetail')
+    
+    # 1. Imprint (MUST BE FIRST)
+    imprint = first_child(children, 'Imprint')
+    if imprint is not None:
+        new_imprint = etree.SubElement(publishing_detail, 'Imprint')
+        imprint_name = etree.SubElement(new_imprint, 'ImprintName')
+        imprint_name.text = imprint.findtext('ImprintName')
+
+    # 2. Publisher with Website
+    publisher = first_child(children, 'Publisher')
+    if publisher is not None:
+        new_publisher = etree.SubElement(publishing_detail, 'Publisher')
+        
+        # Add PublishingRole first
+        pub_role = etree.SubElement(new_publisher, 'PublishingRole')
+        pub_role.text = publisher.findtext('PublishingRole', '01')
+        
+        # Add PublisherName
+        pub_name = etree.SubElement(new_publisher, 'PublisherName')
+        pub_name.text = publisher.findtext('PublisherName')
+        
+        # Add Website within Publisher
+        new_publisher.append(copy.deepcopy(_PUBLISHER_WEBSITE))
+
+    # 3. PublishingStatus
+    status = etree.SubElement(publishing_detail, 'PublishingStatus')
+    status.text = child_text(children, 'PublishingStatus', '02')
+
+    # 4-7. Publishing Date, Sales Rights, ROW Sales Rights Type and
+    # Sales Restrictions are the same for every product
+    publishing_detail.extend(copy.deepcopy(_PUBLISHING_DETAIL_TAIL))
+
+    return publishing_detail
+
+def create_related_material(old_product, children=None):
     """Create RelatedMaterial composite"""
+    if children is None:
+        children = index_children(old_product)
     related_material = etree.Element('RelatedMaterial')
     
     # Add WorkIdentifier in RelatedWork
-    work_identifier = old_product.find('WorkIdentifier')
+    work_identifier = first_child(children, 'WorkIdentifier')
     if work_identifier is not None:
         related_work = etree.SubElement(related_material, 'RelatedWork')
         work_relation = etree.SubElement(related_work, 'WorkRelationCode')
@@ -1330,7 +1515,7 @@ def create_related_material(old_product):
             new_id_value.text = id_value.text
     
     # Process related products
-    for related in old_product.findall('RelatedProduct'):
+    for related in children.get('RelatedProduct', ()):
         related_product = etree.SubElement(related_material, 'RelatedProduct')
         
         # Add ProductRelationCode first
@@ -1340,10 +1525,9 @@ def create_related_material(old_product):
             product_relation.text = relation.text
         
         # Add ProductIdentifiers next
-        for identifier in related.findall('ProductIdentifier'):
-            new_identifier = etree.SubElement(related_product, 'ProductIdentifier')
-            for child in identifier:
-                etree.SubElement(new_identifier, child.tag).text = child.text
+        # ProductIdentifier has the same layout in 2.1 and 3.0, so copy it in C
+        for identifier in related.iterfind('ProductIdentifier'):
+            related_product.append(copy.deepcopy(identifier))
         
         # Add ProductForm if present
         form = related.find('ProductForm')
@@ -1359,46 +1543,43 @@ def create_related_material(old_product):
     
     return related_material
 
+def copy_supply_fields(parent, supply_children, schedule):
+    """Copy SupplyDetail children into parent following a (tag, default, required) schedule"""
+    for tag, default, required in schedule:
+        source = first_child(supply_children, tag)
+        if source is not None:
+            etree.SubElement(parent, tag).text = source.text or ''
+        elif required:
+            etree.SubElement(parent, tag).text = default
+
 def create_supply_detail(old_supply):
     """Create SupplyDetail composite with correct element order"""
     supply_detail = etree.Element('SupplyDetail')
     has_price = False
+    supply_children = index_children(old_supply)
     
     # Process elements in order
     for element_name in SUPPLY_DETAIL_ORDER:
         if element_name == 'Supplier':
             supplier = etree.SubElement(supply_detail, 'Supplier')
-            
-            # Add SupplierRole first
-            role = etree.SubElement(supplier, 'SupplierRole')
-            role.text = old_supply.findtext('SupplierRole', '01')
-            
-            # Add SupplierName
-            name = old_supply.find('SupplierName')
-            if name is not None:
-                supplier_name = etree.SubElement(supplier, 'SupplierName')
-                supplier_name.text = name.text
+            copy_supply_fields(supplier, supply_children, (
+                ('SupplierRole', '01', True),
+                ('SupplierName', None, False),
+            ))
                 
         elif element_name == 'ReturnsConditions':
-            returns_code_type = old_supply.find('ReturnsCodeType')
-            if returns_code_type is not None:
+            if 'ReturnsCodeType' in supply_children:
                 conditions = etree.SubElement(supply_detail, 'ReturnsConditions')
-                type_element = etree.SubElement(conditions, 'ReturnsCodeType')
-                type_element.text = returns_code_type.text
-                
-                returns_code = old_supply.find('ReturnsCode')
-                if returns_code is not None:
-                    code_element = etree.SubElement(conditions, 'ReturnsCode')
-                    code_element.text = returns_code.text
+                copy_supply_fields(conditions, supply_children, (
+                    ('ReturnsCodeType', None, True),
+                    ('ReturnsCode', None, False),
+                ))
                     
         elif element_name == 'ProductAvailability':
-            availability = old_supply.find('ProductAvailability')
-            if availability is not None:
-                new_availability = etree.SubElement(supply_detail, 'ProductAvailability')
-                new_availability.text = availability.text
+            copy_supply_fields(supply_detail, supply_children, (('ProductAvailability', None, False),))
                 
         elif element_name == 'SupplyDate':
-            ship_date = old_supply.find('ExpectedShipDate')
+            ship_date = first_child(supply_children, 'ExpectedShipDate')
             if ship_date is not None:
                 supply_date = etree.SubElement(supply_detail, 'SupplyDate')
                 date_role = etree.SubElement(supply_date, 'SupplyDateRole')
@@ -1407,19 +1588,16 @@ def create_supply_detail(old_supply):
                 date.text = ship_date.text
                 
         elif element_name == 'PackQuantity':
-            pack_qty = old_supply.find('PackQuantity')
-            if pack_qty is not None:
-                new_pack_qty = etree.SubElement(supply_detail, 'PackQuantity')
-                new_pack_qty.text = pack_qty.text
+            copy_supply_fields(supply_detail, supply_children, (('PackQuantity', None, False),))
                 
         elif element_name == 'Territory':
-            countries = old_supply.find('SupplyToCountry')
+            countries = first_child(supply_children, 'SupplyToCountry')
             if countries is not None:
                 territory = create_supply_territory(countries.text)
                 supply_detail.append(territory)
                 
         elif element_name == 'Price':
-            prices = old_supply.findall('Price')
+            prices = supply_children.get('Price', ())
             if prices:
                 for price_element in prices:
                     price = create_price_composite(price_element)
@@ -1433,68 +1611,51 @@ def create_supply_detail(old_supply):
     
     return supply_detail
 
-def create_product_supply(old_product, publisher_data):
+def create_product_supply(old_product, publisher_data, children=None):
     """Create ProductSupply composite preserving existing data"""
+    if children is None:
+        children = index_children(old_product)
     product_supply = etree.Element('ProductSupply')
     
     # Copy existing market information
     market = etree.SubElement(product_supply, 'Market')
-    territory = etree.SubElement(market, 'Territory')
     
     # Get existing supply territories
-    supply_countries = old_product.findall('.//SupplyToCountry')
+    supply_countries = list(old_product.iter('SupplyToCountry'))
+    countries_text = None
     if supply_countries:
-        countries = etree.SubElement(territory, 'CountriesIncluded')
-        countries.text = ' '.join(country.text for country in supply_countries if country.text)
-    else:
-        regions = etree.SubElement(territory, 'RegionsIncluded')
-        regions.text = 'WORLD'
+        countries_text = ' '.join(country.text for country in supply_countries if country.text)
+    market.append(create_market_territory(countries_text))
     
     # Process existing supply details
-    for old_supply in old_product.findall('SupplyDetail'):
+    for old_supply in children.get('SupplyDetail', ()):
         supply_detail = etree.SubElement(product_supply, 'SupplyDetail')
+        supply_children = index_children(old_supply)
         has_price = False
         
         # Copy supplier information
         supplier = etree.SubElement(supply_detail, 'Supplier')
-        supplier_role = etree.SubElement(supplier, 'SupplierRole')
-        supplier_role.text = old_supply.findtext('SupplierRole', '01')
-        
-        supplier_name = etree.SubElement(supplier, 'SupplierName')
-        supplier_name.text = old_supply.findtext('SupplierName')
+        copy_supply_fields(supplier, supply_children, SUPPLIER_FIELDS)
         
         # Copy returns conditions
-        if old_supply.find('ReturnsCodeType') is not None:
+        if 'ReturnsCodeType' in supply_children:
             returns = etree.SubElement(supply_detail, 'ReturnsConditions')
-            returns_type = etree.SubElement(returns, 'ReturnsCodeType')
-            returns_type.text = old_supply.findtext('ReturnsCodeType')
-            returns_code = etree.SubElement(returns, 'ReturnsCode')
-            returns_code.text = old_supply.findtext('ReturnsCode')
-        
-        # Copy availability
-        availability = etree.SubElement(supply_detail, 'ProductAvailability')
-        availability.text = old_supply.findtext('ProductAvailability', '20')
+            copy_supply_fields(returns, supply_children, RETURNS_CONDITIONS_FIELDS)
         
-        # Copy pack quantity
-        if old_supply.find('PackQuantity') is not None:
-            pack_qty = etree.SubElement(supply_detail, 'PackQuantity')
-            pack_qty.text = old_supply.findtext('PackQuantity')
+        # Copy availability and pack quantity
+        copy_supply_fields(supply_detail, supply_children, SUPPLY_STATUS_FIELDS)
         
         # Add form prices if they exist, otherwise keep existing prices
-        supplier_country = old_supply.findtext('SupplyToCountry')
+        supplier_country = child_text(supply_children, 'SupplyToCountry')
         if supplier_country:
-            if 'CA' in supplier_country and publisher_data and publisher_data.get('price_cad'):
-                add_price(supply_detail, publisher_data['price_cad'], 'CAD', 'CA')
-                has_price = True
-            elif 'GB' in supplier_country and publisher_data and publisher_data.get('price_gbp'):
-                add_price(supply_detail, publisher_data['price_gbp'], 'GBP', 'GB')
-                has_price = True
-            elif 'US' in supplier_country and publisher_data and publisher_data.get('price_usd'):
-                add_price(supply_detail, publisher_data['price_usd'], 'USD', 'US')
-                has_price = True
+            for country, price_key, currency in FORM_PRICE_FIELDS:
+                if country in supplier_country and publisher_data and publisher_data.get(price_key):
+                    add_price(supply_detail, publisher_data[price_key], currency, country)
+                    has_price = True
+                    break
             else:
                 # Copy existing prices
-                for old_price in old_supply.findall('Price'):
+                for old_price in supply_children.get('Price', ()):
                     copy_price(supply_detail, old_price)
                     has_price = True
         
@@ -1524,86 +1685,50 @@ def add_price(supply_detail, amount, currency, country):
 def copy_price(supply_detail, old_price):
     """Copy existing price element with proper ONIX 3.0 tag mapping"""
     price = etree.SubElement(supply_detail, 'Price')
+    old_children = index_children(old_price)
     
-    # Only include allowed elements in ONIX 3.0
-    allowed_elements = {
-        'PriceTypeCode': 'PriceType',
-        'PriceAmount': 'PriceAmount',
-        'CurrencyCode': 'CurrencyCode',
-        'CountryCode': 'Territory'
-    }
-    
-    # Process elements in correct order according to ONIX 3.0
-    element_order = [
-        'PriceType',
-        'PriceAmount',
-        'CurrencyCode',
-        'Territory'  # Territory must come last
-    ]
-    
-    # Process elements in correct order
-    for element_name in element_order:
-        # Handle special case for Territory
-        if element_name == 'Territory':
-            country_code = old_price.find('CountryCode')
-            if country_code is not None:
-                territory = etree.SubElement(price, 'Territory')
-                countries = etree.SubElement(territory, 'CountriesIncluded')
-                countries.text = country_code.text
-            continue
-            
-        # Find old element using reverse mapping
-        old_name = next((k for k, v in allowed_elements.items() if v == element_name), element_name)
-        old_element = old_price.find(old_name)
-        
+    # Copy the allowed elements in ONIX 3.0 order
+    for old_name, element_name in PRICE_COPY_MAPPING:
+        old_element = first_child(old_children, old_name)
         if old_element is not None and old_element.text:
             new_element = etree.SubElement(price, element_name)
             new_element.text = old_element.text
+    
+    # Territory must come last
+    country_code = first_child(old_children, 'CountryCode')
+    if country_code is not None:
+        territory = etree.SubElement(price, 'Territory')
+        countries = etree.SubElement(territory, 'CountriesIncluded')
+        countries.text = country_code.text
 
-def process_product(old_product, new_root, epub_features, epub_isbn, publisher_data):
+def process_product(old_product, new_root, epub_features, epub_isbn, publisher_data,
+                    accessibility_features=None):
     """Process complete product composite"""
     try:
         # Create new product
         product = etree.SubElement(new_root, 'Product')
+        children = index_children(old_product)
         
-        # Add RecordReference first (REQUIRED)
-        record_ref = old_product.find('RecordReference')
-        if record_ref is not None:
-            new_ref = etree.SubElement(product, 'RecordReference')
-            new_ref.text = record_ref.text
-            
-        # Add NotificationType (REQUIRED)
-        notif_type = old_product.find('NotificationType')
-        if notif_type is not None:
-            new_notif = etree.SubElement(product, 'NotificationType')
-            new_notif.text = notif_type.text
-            
-        # Add RecordSourceType
-        source_type = old_product.find('RecordSourceType')
-        if source_type is not None:
-            new_source_type = etree.SubElement(product, 'RecordSourceType')
-            new_source_type.text = source_type.text
-            
-        # Add RecordSourceName
-        source_name = old_product.find('RecordSourceName')
-        if source_name is not None:
-            new_source_name = etree.SubElement(product, 'RecordSourceName')
-            new_source_name.text = source_name.text
+        # Add RecordReference and NotificationType (REQUIRED), then the
+        # record source fields
+        for tag in PRODUCT_RECORD_FIELDS:
+            copy_child_element(product, children, tag)
             
         # Track existing identifiers
         existing_identifiers = set()
         
         # Copy product identifiers and validate them
-        for identifier in old_product.findall('ProductIdentifier'):
+        for identifier in children.get('ProductIdentifier', ()):
             new_identifier = convert_product_identifier(identifier, existing_identifiers)
             if new_identifier is not None:
                 product.append(new_identifier)
                 
-        # Validate identifiers after adding them
-        validate_identifiers(product)
+        # Validate identifiers after adding them; existing_identifiers holds
+        # every one that was appended, so the product need not be walked again
+        validate_identifiers(product, existing_identifiers)
         
         # Handle WorkIdentifier first
-        work_identifier = old_product.find('WorkIdentifier')
+        work_identifier = first_child(children, 'WorkIdentifier')
         if work_identifier is not None:
             work_id_type = work_identifier.find('WorkIDType')
             id_value = work_identifier.find('IDValue')
@@ -1623,14 +1748,15 @@ def process_product(old_product, new_root, epub_features, epub_isbn, publisher_d
                     existing_identifiers.add(id_key)
         
         # Handle Barcode element properly - add it at Product level after ProductIdentifier elements
-        old_barcode = old_product.find('Barcode')
+        old_barcode = first_child(children, 'Barcode')
         if old_barcode is not None:
             barcode = etree.SubElement(product, 'Barcode')
             barcode_type = etree.SubElement(barcode, 'BarcodeType')
             barcode_type.text = old_barcode.text
         
         # Create main blocks in correct order with publisher_data
-        descriptive_detail = create_descriptive_detail(old_product, epub_features, publisher_data)
+        descriptive_detail = create_descriptive_detail(old_product, epub_features, publisher_data, children,
+                                                       accessibility_features)
         if len(descriptive_detail) > 0:
             # Ensure this is an EPUB by setting ProductForm to EA
             product_form = descriptive_detail.find('ProductForm')
@@ -1643,30 +1769,15 @@ def process_product(old_product, new_root, epub_features, epub_isbn, publisher_d
                 product_form_detail = etree.SubElement(descriptive_detail, 'ProductFormDetail')
             product_form_detail.text = 'E101'  # EPUB3
             
-            # Ensure EPUB-specific elements exist
-            if descriptive_detail.find('EpubTechnicalProtection') is None:
-                epub_tech = etree.SubElement(descriptive_detail, 'EpubTechnicalProtection')
-                epub_tech.text = '00'  # None
-                
-            if descriptive_detail.find('EpubUsageConstraint') is None:
-                epub_usage = etree.SubElement(descriptive_detail, 'EpubUsageConstraint')
-                usage_type = etree.SubElement(epub_usage, 'EpubUsageType')
-                usage_type.text = '01'  # Preview
-                usage_status = etree.SubElement(epub_usage, 'EpubUsageStatus')
-                usage_status.text = '01'  # Permitted
-                
-            if descriptive_detail.find('EpubLicense') is None:
-                epub_license = etree.SubElement(descriptive_detail, 'EpubLicense')
-                license_name = etree.SubElement(epub_license, 'EpubLicenseName')
-                license_name.text = 'Standard license'
-            
+            # EpubTechnicalProtection, EpubUsageConstraint and EpubLicense
+            # always come from _DESCRIPTIVE_DETAIL_MIDDLE
             product.append(descriptive_detail)
         
         # Create CollateralDetail
-        collateral_detail = create_collateral_detail(old_product)
+        collateral_detail = create_collateral_detail(old_product, children)
         if len(collateral_detail) > 0:
             # Preserve product website in CollateralDetail
-            website = old_product.find('ProductWebsite')
+            website = first_child(children, 'ProductWebsite')
             if website is not None:
                 # Create new supporting resource for website
                 supporting_resource = etree.SubElement(collateral_detail, 'SupportingResource')
@@ -1701,7 +1812,7 @@ def process_product(old_product, new_root, epub_features, epub_isbn, publisher_d
             product.append(collateral_detail)
         
         # Add copyright year to PublishingDetail
-        copyright_year = old_product.find('CopyrightYear')
+        copyright_year = first_child(children, 'CopyrightYear')
         if copyright_year is not None:
             publishing_detail = product.find('PublishingDetail')
             if publishing_detail is not None:
@@ -1709,15 +1820,15 @@ def process_product(old_product, new_root, epub_features, epub_isbn, publisher_d
                 copyright_year_elem = etree.SubElement(copyright, 'CopyrightYear')
                 copyright_year_elem.text = copyright_year.text
         
-        publishing_detail = create_publishing_detail(old_product)
+        publishing_detail = create_publishing_detail(old_product, children)
         if len(publishing_detail) > 0:
             product.append(publishing_detail)
         
-        related_material = create_related_material(old_product)
+        related_material = create_related_material(old_product, children)
         if len(related_material) > 0:
             product.append(related_material)
         
-        product_supply = create_product_supply(old_product, publisher_data)
+        product_supply = create_product_supply(old_product, publisher_data, children)
         if len(product_supply) > 0:
             product.append(product_supply)
         
@@ -1728,23 +1839,19 @@ def process_product(old_product, new_root, epub_features, epub_isbn, publisher_d
         logger.error(traceback.format_exc())
         raise
 
-def validate_identifiers(product):
-    """Validate product identifiers"""
-    identifiers = product.findall('ProductIdentifier')
+def validate_identifiers(product, identifier_keys=None):
+    """
+    Validate product identifiers
+    identifier_keys, when given, holds the (ProductIDType, IDValue) pair of
+    every identifier on the product and is checked instead of walking it
+    """
+    if identifier_keys is not None:
+        id_types = {id_type for id_type, id_value in identifier_keys}
+    else:
+        id_types = {identifier.findtext('ProductIDType') for identifier in product.iterfind('ProductIdentifier')}
     
     # Check for required identifier types
-    has_isbn13 = False
-    has_isbn10 = False
-    
-    for identifier in identifiers:
-        id_type = identifier.find('ProductIDType')
-        if id_type is not None:
-            if id_type.text == '15':  # ISBN-13
-                has_isbn13 = True
-            elif id_type.text == '02':  # ISBN-10 
-                has_isbn10 = True
-                
-    if not (has_isbn13 or has_isbn10):
+    if ISBN_ID_TYPES.isdisjoint(id_types):
         raise ValueError("Product must have either ISBN-13 or ISBN-10")
 
 def count_illustrations(old_product):
@@ -1752,7 +1859,7 @@ def count_illustrations(old_product):
     total = 0
     
     # Count standard illustrations
-    for illus in old_product.findall('Illustrations'):
+    for illus in old_product.iterfind('Illustrations'):
         number = illus.find('Number')
         if number is not None and number.text:
             try:
@@ -1761,36 +1868,97 @@ def count_illustrations(old_product):
                 pass
                 
     # Count figures from other sources
-    for figure in old_product.findall('.//Figure'):
+    for figure in old_product.iter('Figure'):
         total += 1
         
     return total
 
-def process_onix(epub_features, xml_content, epub_isbn, publisher_data=None):
-    """Process complete ONIX content"""
+def flush_onix_message(new_root, write, started):
+    """
+    Serialize the children built so far under new_root with write() and drop
+    them. started says whether the declaration and start tag have already
+    been written; the updated value is returned.
+    """
+    if not len(new_root):
+        return started
+    serialized = etree.tostring(new_root, pretty_print=True, xml_declaration=False, encoding='utf-8')
+    # The first line is the ONIXMessage start tag and the last its end tag
+    start_tag, body = serialized.split(b'\n', 1)
+    if not started:
+        write(b"<?xml version='1.0' encoding='utf-8'?>\n" + start_tag + b'\n')
+    write(body[:-len(b'</ONIXMessage>\n')])
+    del new_root[:]
+    return True
+
+def process_onix(epub_features, xml_content, epub_isbn, publisher_data=None, output=None):
+    """
+    Process complete ONIX content
+    Args:
+        xml_content: ONIX XML as bytes, or a binary file object which is
+            parsed directly without reading it into memory first
+        output: optional binary file object; when given, the ONIX 3.0 document
+            is written to it and None is returned instead of the bytes
+    Products are converted as soon as each one has been parsed and are then
+    dropped from the source tree, and each converted product is serialized
+    straight away, so neither tree grows with catalog size.
+    """
     try:
-        parser = etree.XMLParser(remove_blank_text=True)
-        tree = etree.fromstring(xml_content, parser)
-        logger.info(f"XML parsed successfully. Root tag: {tree.tag}")
-        
-        # Determine original version
-        original_version, is_reference = get_original_version(tree)
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
+        if isinstance(xml_content, bytes):
+            xml_content = io.BytesIO(xml_content)
         
         # Create new ONIX 3.0 document
         new_root = etree.Element('ONIXMessage', nsmap=NSMAP)
         new_root.set("release", "3.0")
         
-        # Process header
-        process_header(tree, new_root, original_version, publisher_data)
-        
-        # Process products
-        if tree.tag.endswith('Product'):
-            process_product(tree, new_root, epub_features, epub_isbn, publisher_data)
+        accessibility_features = build_accessibility_features(epub_features)
+        
+        chunks = []
+        write = output.write if output is not None else chunks.append
+        started = False
+        root = None
+        header_done = False
+        depth = 0
+        for event, elem in etree.iterparse(xml_content, events=('start', 'end'), remove_blank_text=True,
+                                           collect_ids=False):
+            if event == 'start':
+                depth += 1
+                if root is None:
+                    root = elem
+                    logger.info(f"Parsing XML. Root tag: {root.tag}")
+                # Everything before the first Product (i.e. the Header) is
+                # complete by now, so the version can be read from it
+                if not header_done and local_name(elem.tag) == 'Product':
+                    original_version, is_reference = get_original_version(root)
+                    process_header(root, new_root, original_version, publisher_data)
+                    header_done = True
+                    started = flush_onix_message(new_root, write, started)
+                continue
+            
+            depth -= 1
+            if depth == 0:
+                # A bare <Product> document is converted as a whole
+                if root.tag.endswith('Product'):
+                    process_product(root, new_root, epub_features, epub_isbn, publisher_data,
+                                    accessibility_features)
+            elif local_name(elem.tag) == 'Product':
+                process_product(elem, new_root, epub_features, epub_isbn, publisher_data,
+                                accessibility_features)
+                elem.clear()
+                elem.getparent().remove(elem)
+                started = flush_onix_message(new_root, write, started)
+        
+        if not header_done:
+            original_version, is_reference = get_original_version(root)
+            process_header(root, new_root, original_version, publisher_data)
+        started = flush_onix_message(new_root, write, started)
+        
+        if started:
+            write(b'</ONIXMessage>\n')
         else:
-            for old_product in tree.xpath('.//*[local-name() = "Product"]'):
-                process_product(old_product, new_root, epub_features, epub_isbn, publisher_data)
-        
-        return etree.tostring(new_root, pretty_print=True, xml_declaration=True, encoding='utf-8')
+            write(etree.tostring(new_root, pretty_print=True, xml_declaration=True, encoding='utf-8'))
+        return b''.join(chunks) if output is None else None
         
     except Exception as e:
         logger.error(f"Error processing ONIX: {str(e)}")
@@ -1814,7 +1982,8 @@ def fix_publishing_detail(file_path):
         ns = {'onix': 'http://ns.editeur.org/onix/3.0/reference'}
 
         # Find all PublishingDetail elements
-        publishing_details = root.xpath('.//onix:PublishingDetail', namespaces=ns)
+        # (collected first, since children are removed while looping)
+        publishing_details = list(root.iter(f'{{{ONIX_30_NS}}}PublishingDetail'))
 
         # Loop through each PublishingDetail and remove problematic elements
         for publishing_detail in publishing_details:
@@ -1839,22 +2008,24 @@ def fix_publishing_detail(file_path):
 def process_onix_file(input_path, output_path, epub_features=None, epub_isbn=None, publisher_data=None):
     """Process ONIX file from input path to output path"""
     try:
-        # Step 1: Fix problematic elements in PublishingDetail
-        fix_publishing_detail(input_path)
-
-        # Step 2: Read the fixed XML file
-        with open(input_path, 'rb') as f:
-            xml_content = f.read()
-
-        # Step 3: Process the ONIX file as usual
-        output_content = process_onix(epub_features, xml_content, epub_isbn, publisher_data)
-
-        # Step 4: Write the processed ONIX file to the output path
-        with open(output_path, 'wb') as f:
-            f.write(output_content)
-
-        # Add debug logging
-        print("DEBUG: Publisher data received:", publisher_data)
+        # Stream the XML file through the converter, which drops each source
+        # Product once it has been converted and writes the result straight
+        # out. The input is no longer passed through fix_publishing_detail
+        # first: the converter builds PublishingDetail from scratch and never
+        # copies CityOfPublication or CountryOfPublication, so that extra
+        # parse and rewrite of the input file had no effect on the output.
+        # The document goes to a temporary file so a failed run never leaves
+        # a truncated file at output_path
+        temp_path = output_path + '.tmp'
+        try:
+            with open(input_path, 'rb') as f, open(temp_path, 'wb') as out:
+                process_onix(epub_features, f, epub_isbn, publisher_data, output=out)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        logger.debug("Publisher data received: %s", publisher_data)
     
         print(f"Successfully processed ONIX file from {input_path} to {output_path}")
 
@@ -1863,13 +2034,17 @@ def process_onix_file(input_path, output_path, epub_features=None, epub_isbn=Non
         raise
     
 def validate_onix_output(xml_content):
-    """Validate the generated ONIX output"""
+    """Validate the generated ONIX output, given as bytes or an already parsed root element"""
     try:
-        parser = etree.XMLParser(remove_blank_text=True)
-        root = etree.fromstring(xml_content, parser)
+        if etree.iselement(xml_content):
+            root = xml_content
+        else:
+            # ONIX does not use xml:id, so skip building the ID table
+            parser = etree.XMLParser(remove_blank_text=True, collect_ids=False)
+            root = etree.fromstring(xml_content, parser)
         
         # Basic validation checks
-        if root.tag != f'{{{ONIX_30_NS}}}ONIXMessage':
+        if root.tag != ONIX_30_TAGS['ONIXMessage']:
             raise ValueError("Invalid root element")
             
         release = root.get('release')
@@ -1877,16 +2052,20 @@ def validate_onix_output(xml_content):
             raise ValueError("Invalid ONIX release version")
             
         # Check header requirements
-        header = root.find(f'.//{{{ONIX_30_NS}}}Header')
+        header = find_descendant(root, ONIX_30_TAGS['Header'])
         if header is None:
             raise ValueError("Missing Header element")
             
-        sender = header.find(f'.//{{{ONIX_30_NS}}}Sender')
+        sender = find_descendant(header, ONIX_30_TAGS['Sender'])
         if sender is None:
             raise ValueError("Missing Sender in Header")
             
+        descriptive_positions = get_order_positions(DESCRIPTIVE_DETAIL_ORDER)
+        text_content_positions = get_order_positions(TEXT_CONTENT_ORDER)
+        price_positions = get_order_positions(PRICE_ELEMENT_ORDER)
+        
         # Validate each product
-        for product in root.findall(f'.//{{{ONIX_30_NS}}}Product'):
+        for product in root.iter(ONIX_30_TAGS['Product']):
             # Check required product elements
             required_elements = [
                 'RecordReference',
@@ -1896,65 +2075,65 @@ def validate_onix_output(xml_content):
             ]
             
             for element in required_elements:
-                if product.find(f'.//{{{ONIX_30_NS}}}{element}') is None:
+                if find_descendant(product, ONIX_30_TAGS[element]) is None:
                     raise ValueError(f"Missing required element: {element}")
             
             # Validate DescriptiveDetail
-            desc_detail = product.find(f'.//{{{ONIX_30_NS}}}DescriptiveDetail')
+            desc_detail = find_descendant(product, ONIX_30_TAGS['DescriptiveDetail'])
             if desc_detail is not None:
                 # Check required DescriptiveDetail elements
-                if desc_detail.find(f'.//{{{ONIX_30_NS}}}ProductComposition') is None:
+                if find_descendant(desc_detail, ONIX_30_TAGS['ProductComposition']) is None:
                     raise ValueError("Missing ProductComposition in DescriptiveDetail")
-                if desc_detail.find(f'.//{{{ONIX_30_NS}}}ProductForm') is None:
+                if find_descendant(desc_detail, ONIX_30_TAGS['ProductForm']) is None:
                     raise ValueError("Missing ProductForm in DescriptiveDetail")
                     
                 # Validate element order in DescriptiveDetail
                 prev_index = -1
                 for child in desc_detail:
-                    child_name = etree.QName(child).localname
-                    if child_name in DESCRIPTIVE_DETAIL_ORDER:
-                        current_index = DESCRIPTIVE_DETAIL_ORDER.index(child_name)
+                    child_name = local_name(child.tag)
+                    current_index = descriptive_positions.get(child_name)
+                    if current_index is not None:
                         if current_index < prev_index:
                             raise ValueError(f"Invalid element order in DescriptiveDetail: {child_name}")
                         prev_index = current_index
             
             # Validate TextContent elements
-            for text_content in product.findall(f'.//{{{ONIX_30_NS}}}TextContent'):
-                if text_content.find(f'.//{{{ONIX_30_NS}}}TextType') is None:
+            for text_content in product.iter(ONIX_30_TAGS['TextContent']):
+                if find_descendant(text_content, ONIX_30_TAGS['TextType']) is None:
                     raise ValueError("Missing TextType in TextContent")
-                if text_content.find(f'.//{{{ONIX_30_NS}}}ContentAudience') is None:
+                if find_descendant(text_content, ONIX_30_TAGS['ContentAudience']) is None:
                     raise ValueError("Missing ContentAudience in TextContent")
                     
                 # Validate TextContent element order
                 prev_index = -1
                 for child in text_content:
-                    child_name = etree.QName(child).localname
-                    if child_name in TEXT_CONTENT_ORDER:
-                        current_index = TEXT_CONTENT_ORDER.index(child_name)
+                    child_name = local_name(child.tag)
+                    current_index = text_content_positions.get(child_name)
+                    if current_index is not None:
                         if current_index < prev_index:
                             raise ValueError(f"Invalid element order in TextContent: {child_name}")
                         prev_index = current_index
             
             # Validate Website elements
-            for website in product.findall(f'.//{{{ONIX_30_NS}}}Website'):
-                if website.find(f'.//{{{ONIX_30_NS}}}WebsiteRole') is None:
+            for website in product.iter(ONIX_30_TAGS['Website']):
+                if find_descendant(website, ONIX_30_TAGS['WebsiteRole']) is None:
                     raise ValueError("Missing WebsiteRole in Website")
-                if website.find(f'.//{{{ONIX_30_NS}}}WebsiteLink') is None:
+                if find_descendant(website, ONIX_30_TAGS['WebsiteLink']) is None:
                     raise ValueError("Missing WebsiteLink in Website")
             
             # Validate Price elements
-            for price in product.findall(f'.//{{{ONIX_30_NS}}}Price'):
-                if price.find(f'.//{{{ONIX_30_NS}}}PriceType') is None:
+            for price in product.iter(ONIX_30_TAGS['Price']):
+                if find_descendant(price, ONIX_30_TAGS['PriceType']) is None:
                     raise ValueError("Missing PriceType in Price")
-                if price.find(f'.//{{{ONIX_30_NS}}}PriceAmount') is None:
+                if find_descendant(price, ONIX_30_TAGS['PriceAmount']) is None:
                     raise ValueError("Missing PriceAmount in Price")
                 
                 # Validate Price element order
                 prev_index = -1
                 for child in price:
-                    child_name = etree.QName(child).localname
-                    if child_name in PRICE_ELEMENT_ORDER:
-                        current_index = PRICE_ELEMENT_ORDER.index(child_name)
+                    child_name = local_name(child.tag)
+                    current_index = price_positions.get(child_name)
+                    if current_index is not None:
                         if current_index < prev_index:
                             raise ValueError(f"Invalid element order in Price: {child_name}")
                         prev_index = current_index
@@ -43,6 +43,21 @@ def validate_price(price_str):
         logger.warning(f"Price validation error for {price_str}: {str(e)}")
         return "0.00"
 
+def descendant_texts(element, local_name):
+    """
+    Non-empty text of each descendant with the given local name in any namespace.
+    Same result as element.xpath('.//*[local-name() = "X"]/text()') for leaf
+    elements, but walks the tree in C instead of evaluating local-name() per node
+    """
+    return [node.text for node in element.iterdescendants('{*}' + local_name) if node.text]
+
+def first_descendant_text(element, local_name, default=None):
+    """First value descendant_texts() would return, stopping the walk at the first match"""
+    for node in element.iterdescendants('{*}' + local_name):
+        if node.text:
+            return node.text
+    return default
+
 def get_element_text(parent, xpath, default=""):
     """Safely get element text using xpath"""
     try:
@@ -64,10 +64,15 @@ def process_form_features(descriptive_detail, old_product, epub_features):
     # Add accessibility features
     for code, is_present in epub_features.items():
         if is_present and code in CODELIST_196:
-            feature = etree.SubElement(descriptive_detail, 'ProductFormFeature')
-            etree.SubElement(feature, 'ProductFormFeatureType').text = "09"
-            etree.SubElement(feature, 'ProductFormFeatureValue').text = code
-            etree.SubElement(feature, 'ProductFormFeatureDescription').text = CODELIST_196[code]
+            add_accessibility_feature(descriptive_detail, code, CODELIST_196[code])
+
+def add_accessibility_feature(descriptive_detail, code, description):
+    """Append a ProductFormFeature of type 09 (accessibility) for the given code"""
+    feature = etree.SubElement(descriptive_detail, 'ProductFormFeature')
+    etree.SubElement(feature, 'ProductFormFeatureType').text = "09"
+    etree.SubElement(feature, 'ProductFormFeatureValue').text = code
+    etree.SubElement(feature, 'ProductFormFeatureDescription').text = description
+    return feature
 
 def process_titles(descriptive_detail, old_product):
     """Process title information"""
@@ -2,6 +2,7 @@
 import logging
 from datetime import datetime
 from lxml import etree
+from ..onix_utils import first_descendant_text
 
 logger = logging.getLogger(__name__)
 
@@ -16,36 +17,35 @@ def process_header(root, new_root, original_version, publisher_data=None):
         name_elem = etree.SubElement(sender, 'SenderName')
         name_elem.text = publisher_data['sender_name']
     else:
-        from_company = root.xpath('.//*[local-name() = "FromCompany"]/text()')
+        from_company = first_descendant_text(root, 'FromCompany')
         if from_company:
             name_elem = etree.SubElement(sender, 'SenderName')
-            name_elem.text = from_company[0]
+            name_elem.text = from_company
         else:
-            from_company = root.xpath('.//*[local-name() = "RecordSourceName"]/text()')
             name_elem = etree.SubElement(sender, 'SenderName')
-            name_elem.text = from_company[0] if from_company else "Default Company Name"
+            name_elem.text = first_descendant_text(root, 'RecordSourceName', "Default Company Name")
 
     if publisher_data and publisher_data.get('contact_name'):
         contact_elem = etree.SubElement(sender, 'ContactName')
         contact_elem.text = publisher_data['contact_name']
     else:
-        contact_name = root.xpath('.//*[local-name() = "ContactName"]/text()')
+        contact_name = first_descendant_text(root, 'ContactName')
         if contact_name:
             contact_elem = etree.SubElement(sender, 'ContactName')
-            contact_elem.text = contact_name[0]
+            contact_elem.text = contact_name
 
     if publisher_data and publisher_data.get('email'):
         email_elem = etree.SubElement(sender, 'EmailAddress')
         email_elem.text = publisher_data['email']
     else:
-        email = root.xpath('.//*[local-name() = "EmailAddress"]/text()')
+        email = first_descendant_text(root, 'EmailAddress')
         if email:
             email_elem = etree.SubElement(sender, 'EmailAddress')
-            email_elem.text = email[0]
+            email_elem.text = email
 
     sent_date_time = etree.SubElement(header, 'SentDateTime')
     sent_date_time.text = datetime.now().strftime("%Y%m%dT%H%M%S")
 
-    message_note = root.xpath('.//*[local-name() = "MessageNote"]/text()')
+    message_note = first_descendant_text(root, 'MessageNote')
     note_elem = etree.SubElement(header, 'MessageNote')
-    note_elem.text = message_note[0] if message_note else f"This file was remediated to include accessibility information. Original ONIX version: {original_version}"
\ No newline at end of file
+    note_elem.text = message_note if message_note else f"This file was remediated to include accessibility information. Original ONIX version: {original_version}"
\ No newline at end of file
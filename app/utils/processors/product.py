@@ -2,6 +2,7 @@
 import logging
 from lxml import etree
 from ..onix_constants import DEFAULT_NOTIFICATION_TYPE
+from ..onix_utils import descendant_texts
 from .descriptive import process_descriptive_detail
 from .collateral import process_collateral_detail
 from .publishing import process_publishing_detail
@@ -14,13 +15,13 @@ def process_product(old_product, new_root, epub_features, epub_isbn, publisher_d
     new_product = etree.SubElement(new_root, "Product")
     
     # Record Reference
-    record_ref = old_product.xpath('.//*[local-name() = "RecordReference"]/text()')
+    record_ref = descendant_texts(old_product, 'RecordReference')
     ref_element = etree.SubElement(new_product, 'RecordReference')
     ref_element.text = record_ref[0] if record_ref else f"EPUB_{epub_isbn}"
 
     # Notification Type
     notify_element = etree.SubElement(new_product, 'NotificationType')
-    notify_type = old_product.xpath('.//*[local-name() = "NotificationType"]/text()')
+    notify_type = descendant_texts(old_product, 'NotificationType')
     notify_element.text = notify_type[0] if notify_type else DEFAULT_NOTIFICATION_TYPE
 
     # Process identifiers without duplicates
@@ -36,8 +37,8 @@ def process_identifiers(new_product, old_product, epub_isbn):
     """Process product identifiers without duplicates"""
     processed_types = set()
     
-    for old_identifier in old_product.xpath('.//*[local-name() = "ProductIdentifier"]'):
-        id_type = old_identifier.xpath('.//*[local-name() = "ProductIDType"]/text()')
+    for old_identifier in old_product.iterdescendants('{*}ProductIdentifier'):
+        id_type = descendant_texts(old_identifier, 'ProductIDType')
         if id_type and id_type[0] not in processed_types:
             new_identifier = etree.SubElement(new_product, 'ProductIdentifier')
             type_elem = etree.SubElement(new_identifier, 'ProductIDType')
@@ -47,7 +48,7 @@ def process_identifiers(new_product, old_product, epub_isbn):
             if id_type[0] in ["03", "15"]:  # ISBN-13
                 value_elem.text = epub_isbn
             else:
-                old_value = old_identifier.xpath('.//*[local-name() = "IDValue"]/text()')
+                old_value = descendant_texts(old_identifier, 'IDValue')
                 value_elem.text = old_value[0] if old_value else ''
             
             processed_types.add(id_type[0])
\ No newline at end of file
@@ -2,7 +2,7 @@
 import logging
 from lxml import etree
 from ..onix_constants import DEFAULT_SUPPLIER_ROLE
-from ..onix_utils import validate_price
+from ..onix_utils import validate_price, descendant_texts
 
 logger = logging.getLogger(__name__)
 
@@ -21,8 +21,8 @@ def process_market(product_supply, old_product):
     territory = etree.SubElement(market, 'Territory')
     
     # Ensure at least one territory element is present
-    countries = old_product.xpath('.//*[local-name() = "CountriesIncluded"]/text()')
-    regions = old_product.xpath('.//*[local-name() = "RegionsIncluded"]/text()')
+    countries = descendant_texts(old_product, 'CountriesIncluded')
+    regions = descendant_texts(old_product, 'RegionsIncluded')
     
     if countries:
         countries_elem = etree.SubElement(territory, 'CountriesIncluded')
@@ -48,13 +48,13 @@ def process_supply_detail(product_supply, old_product, publisher_data=None):
         name_elem = etree.SubElement(supplier, 'SupplierName')
         name_elem.text = publisher_data['sender_name']
     else:
-        supplier_name = old_product.xpath('.//*[local-name() = "SupplierName"]/text()')
+        supplier_name = descendant_texts(old_product, 'SupplierName')
         if supplier_name:
             name_elem = etree.SubElement(supplier, 'SupplierName')
             name_elem.text = supplier_name[0]
     
     # Product Availability
-    availability = old_product.xpath('.//*[local-name() = "ProductAvailability"]/text()')
+    availability = descendant_texts(old_product, 'ProductAvailability')
     if availability:
         avail_elem = etree.SubElement(supply_detail, 'ProductAvailability')
         avail_elem.text = availability[0]
@@ -89,15 +89,15 @@ def process_prices(supply_detail, old_product, publisher_data=None):
             currency.text = 'USD'
     else:
         # Process existing prices if no publisher data
-        for old_price in old_product.xpath('.//*[local-name() = "Price"]'):
+        for old_price in old_product.iterdescendants('{*}Price'):
             price = etree.SubElement(supply_detail, 'Price')
             
-            price_amount = old_price.xpath('.//*[local-name() = "PriceAmount"]/text()')
+            price_amount = descendant_texts(old_price, 'PriceAmount')
             if price_amount:
                 amount_elem = etree.SubElement(price, 'PriceAmount')
                 amount_elem.text = validate_price(price_amount[0])
             
-            currency = old_price.xpath('.//*[local-name() = "CurrencyCode"]/text()')
+            currency = descendant_texts(old_price, 'CurrencyCode')
             if currency:
                 currency_elem = etree.SubElement(price, 'CurrencyCode')
                 currency_elem.text = currency[0]
\ No newline at end of file